@@ -0,0 +1,67 @@
+"""
+Time `import bitstring_energy` in fresh interpreters.
+
+    python benchmarks/bench_import.py --repeat 10 --max-ms 500
+
+Prints the timings as JSON, and exits with status 1 when the median is
+above --max-ms, so the script can guard the startup cost in CI.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import numpy as np
+
+HEAVY_MODULES = ("networkx", "matplotlib", "numba", "scipy")
+
+
+def time_import(module: str) -> tuple:
+    """
+    Import a module in a new interpreter
+
+    Returns
+    -------
+    (seconds, loaded) : tuple
+        wall time of the import, measured inside the interpreter, and the
+        heavy optional modules it pulled in
+    """
+    code = (f"import sys, time; t = time.perf_counter(); import {module}; t = time.perf_counter() - t; "
+            f"print(t); print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    lines = out.splitlines() + [""]
+    return float(lines[0]), lines[1].split()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="number of fresh interpreters")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail when the median is slower")
+    args = parser.parse_args(argv)
+
+    # the first run also warms the bytecode and OS file caches
+    time_import("bitstring_energy")
+    numpy_times = [time_import("numpy")[0] for _ in range(args.repeat)]
+    runs = [time_import("bitstring_energy") for _ in range(args.repeat)]
+    package_times = [t for t, _ in runs]
+    result = {
+        "benchmark": "import",
+        "repeat": args.repeat,
+        "median_ms": 1e3*float(np.median(package_times)),
+        "min_ms": 1e3*float(np.min(package_times)),
+        "numpy_median_ms": 1e3*float(np.median(numpy_times)),
+        "heavy_modules": runs[-1][1],
+    }
+    print(json.dumps(result, indent=2))
+
+    if result["heavy_modules"]:
+        print(f"import bitstring_energy loaded {result['heavy_modules']}", file=sys.stderr)
+        return 1
+    if args.max_ms is not None and result["median_ms"] > args.max_ms:
+        print(f"median import time {result['median_ms']:.1f} ms is above {args.max_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
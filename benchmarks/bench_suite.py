@@ -0,0 +1,298 @@
+"""
+Throughput and memory benchmarks of the BitString, energy, enumeration and
+Monte Carlo hot paths.
+
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --quick --baseline benchmarks/baselines/reference.json
+    python benchmarks/bench_suite.py --lattice chain square --sizes 256 4096 --group metropolis
+
+Every result is a throughput (higher is better) with the peak memory
+allocated by one call, measured with tracemalloc in a separate run. The
+results are written as JSON, and with --baseline they are compared to a
+previous run: the script exits with status 1 when a throughput drops, or a
+peak memory grows, by more than --tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import bitstring_energy as bse
+from bitstring_energy.Kernels import available_backends
+from bitstring_energy.MonteCarlo import _sweep
+
+GROUPS = ("bitstring", "energy", "enumeration", "metropolis")
+LATTICES = ("chain", "square", "cubic")
+
+# (sizes of the Monte Carlo and energy systems, sizes of the enumerated systems)
+DEFAULT_SIZES = ([64, 1024, 16384], [12, 16, 20])
+QUICK_SIZES = ([64, 1024], [10, 14])
+
+
+def lattice_shape(lattice: str, n: int) -> tuple:
+    """
+    Shape of the periodic lattice of about n sites, a full square or cube
+    """
+    dims = {"chain": 1, "square": 2, "cubic": 3}[lattice]
+    return (max(2, int(round(n**(1.0 / dims)))),) * dims
+
+
+def lattice_sizes(lattice: str, sizes: list) -> list:
+    """
+    Distinct numbers of sites of the lattices built for the requested sizes,
+    so that no benchmark runs, and is keyed, twice
+    """
+    return sorted({int(np.prod(lattice_shape(lattice, n))) for n in sizes})
+
+
+def build_lattice(lattice: str, n: int, seed: int = 0) -> bse.IsingHamiltonian:
+    """
+    Periodic lattice of about n sites with +-1 couplings and small random fields
+
+    Parameters
+    ----------
+    lattice : str
+        "chain", "square" or "cubic"
+    n : int
+        Target number of sites, rounded to a full square or cube
+    seed : int
+        Seed of the couplings
+
+    Returns
+    -------
+    IsingHamiltonian
+        The lattice Hamiltonian
+    """
+    shape = lattice_shape(lattice, n)
+    src, dst = bse.hypercubic_edges(shape)
+    rng = np.random.default_rng(seed)
+    return bse.IsingHamiltonian.from_edges(src, dst, rng.choice([-1.0, 1.0], len(src)),
+                                           rng.choice([-0.1, 0.0, 0.1], int(np.prod(shape))))
+
+
+def measure(fn, min_time: float) -> tuple:
+    """
+    Time repeated calls of fn after a warm-up call
+
+    Returns
+    -------
+    (seconds, peak_mb) : tuple
+        Best time of one call, and the peak memory allocated during a call
+    """
+    fn()
+    best = np.inf
+    total = 0.0
+    # at least one timed call, however short min_time is
+    while best == np.inf or total < min_time:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak / 2**20
+
+
+def result(group: str, name: str, lattice: str, n: int, metric: str, work: float, fn, min_time: float) -> dict:
+    """
+    Benchmark fn, which does `work` units of `metric` per call
+    """
+    seconds, peak_mb = measure(fn, min_time)
+    return {"group": group, "name": name, "lattice": lattice, "n": int(n),
+            "metric": metric, "value": work / seconds, "peak_mb": peak_mb}
+
+
+def bench_bitstring(lattices: list, sizes: tuple, min_time: float) -> list:
+    """
+    Integer conversions of single bitstrings and of whole arrays
+    """
+    results = []
+    for n in sorted(set(sizes[1])):
+        bits = bse.BitString(n)
+        values = np.arange(4096, dtype=np.int64) % 2**n
+
+        def roundtrip():
+            for value in values[:256].tolist():
+                bits.set_int_config(value)
+                bits.int()
+        results.append(result("bitstring", "set_int_config+int", "-", n, "conversions_per_s", 256,
+                              roundtrip, min_time))
+        results.append(result("bitstring", "int_to_bits", "-", n, "bits_per_s", 4096 * n,
+                              lambda: bse.int_to_bits(values, n), min_time))
+        array = bse.BitStringArray.from_ints(values, n)
+        results.append(result("bitstring", "BitStringArray.int", "-", n, "bits_per_s", 4096 * n,
+                              array.int, min_time))
+    return results
+
+
+def bench_energy(lattices: list, sizes: tuple, min_time: float) -> list:
+    """
+    Energy of one configuration at a time and of batches
+    """
+    results = []
+    rng = np.random.default_rng(1)
+    for lattice in lattices:
+        for size in lattice_sizes(lattice, sizes[0]):
+            ham = build_lattice(lattice, size)
+            configs = bse.BitStringArray(configs=rng.integers(0, 2, (256, ham.n)))
+            single = configs[0]
+            results.append(result("energy", "energy", lattice, ham.n, "evaluations_per_s", 1,
+                                  lambda: ham.energy(single), min_time))
+            results.append(result("energy", "energies", lattice, ham.n, "evaluations_per_s", len(configs),
+                                  lambda: ham.energies(configs), min_time))
+    return results
+
+
+def bench_enumeration(lattices: list, sizes: tuple, min_time: float) -> list:
+    """
+    Exact averages over all the states, and the transfer matrices of chains
+    """
+    results = []
+    for lattice in lattices:
+        for size in lattice_sizes(lattice, sizes[1]):
+            ham = build_lattice(lattice, size)
+            n = ham.n
+            if n > 24:
+                continue
+            for method in ("gray", "vectorized"):
+                results.append(result("enumeration", f"exact_average_values[{method}]", lattice, n,
+                                      "states_per_s", 2**n,
+                                      lambda: bse.exact_average_values(ham, n, 2.0, method=method), min_time))
+        if lattice == "chain":
+            for size in lattice_sizes(lattice, sizes[0]):
+                ham = build_lattice(lattice, size)
+                results.append(result("enumeration", "TransferMatrix", lattice, ham.n, "sites_per_s", ham.n,
+                                      lambda: bse.TransferMatrix(ham).average_values(2.0), min_time))
+    return results
+
+
+def bench_metropolis(lattices: list, sizes: tuple, min_time: float) -> list:
+    """
+    Single spin flip and cluster updates, one sweep per call
+    """
+    backends = [None, "checkerboard"] + available_backends() + ["swendsen_wang", "wolff"]
+    results = []
+    for lattice in lattices:
+        for size in lattice_sizes(lattice, sizes[0]):
+            ham = build_lattice(lattice, size)
+            for backend in backends:
+                # the pure Python loops are too slow to be timed on large systems
+                if backend in (None, "python") and ham.n > 4096:
+                    continue
+                conf = bse.BitString(ham.n)
+                conf.set_config(np.random.default_rng(2).integers(0, 2, ham.n))
+                rng = np.random.default_rng(3)
+                name = "metropolis_step" if backend is None else backend
+                metric = "clusters_per_s" if backend == "wolff" else "spin_flips_per_s"
+                work = 1 if backend == "wolff" else ham.n
+                results.append(result("metropolis", name, lattice, ham.n, metric, work,
+                                      lambda: _sweep(ham, conf, 2.0, backend, rng), min_time))
+    return results
+
+
+BENCHMARKS = {"bitstring": bench_bitstring, "energy": bench_energy,
+              "enumeration": bench_enumeration, "metropolis": bench_metropolis}
+
+
+def machine() -> dict:
+    """
+    Description of the machine and software the benchmarks ran on
+    """
+    return {"platform": platform.platform(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "python": platform.python_version(),
+            "numpy": np.__version__, "bitstring_energy": bse.__version__,
+            "backends": available_backends()}
+
+
+def key(entry: dict) -> tuple:
+    return (entry["group"], entry["name"], entry["lattice"], entry["n"])
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """
+    Compare results to a baseline run
+
+    Parameters
+    ----------
+    results : list
+        Entries of this run
+    baseline : list
+        Entries of the baseline run
+    tolerance : float
+        Allowed relative loss of throughput or growth of peak memory
+
+    Returns
+    -------
+    regressions : list
+        Description of every entry worse than the baseline by more than the
+        tolerance
+    """
+    reference = {key(entry): entry for entry in baseline}
+    regressions = []
+    print(f"\n{'benchmark':58s} {'baseline':>12s} {'now':>12s} {'ratio':>7s}")
+    for entry in results:
+        old = reference.get(key(entry))
+        if old is None:
+            continue
+        ratio = entry["value"] / old["value"]
+        label = "{group}/{name} {lattice} n={n}".format(**entry)
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  slower"
+            regressions.append(f"{label}: {entry['metric']} {ratio:.2f}x the baseline")
+        if entry["peak_mb"] > (1 + tolerance) * old["peak_mb"] + 0.1:
+            flag += "  memory"
+            regressions.append(f"{label}: peak memory {entry['peak_mb']:.1f} MB, was {old['peak_mb']:.1f} MB")
+        print(f"{label:58s} {old['value']:12.4g} {entry['value']:12.4g} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--group", nargs="+", choices=GROUPS, default=list(GROUPS), help="benchmarks to run")
+    parser.add_argument("--lattice", nargs="+", choices=LATTICES, default=["chain", "square"],
+                        help="lattice types of the systems")
+    parser.add_argument("--sizes", nargs="+", type=int, default=None,
+                        help="numbers of sites of the Monte Carlo and energy systems")
+    parser.add_argument("--enum-sizes", nargs="+", type=int, default=None,
+                        help="numbers of sites of the enumerated systems")
+    parser.add_argument("--quick", action="store_true", help="small systems and short timings")
+    parser.add_argument("--min-time", type=float, default=None, help="seconds spent timing each benchmark")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    defaults = QUICK_SIZES if args.quick else DEFAULT_SIZES
+    sizes = (args.sizes or defaults[0], args.enum_sizes or defaults[1])
+    min_time = args.min_time if args.min_time is not None else (0.05 if args.quick else 0.5)
+
+    results = []
+    for group in args.group:
+        for entry in BENCHMARKS[group](args.lattice, sizes, min_time):
+            print("{group:12s} {name:34s} {lattice:7s} n={n:<6d} {value:12.4g} {metric:18s} "
+                  "{peak_mb:8.2f} MB".format(**entry), flush=True)
+            results.append(entry)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"machine": machine(), "results": results}, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Simulated annealing search for low energy configurations."""
+
+import numpy as np
+from .BitString import BitString as bs
+from .Energy import IsingHamiltonian as ham
+from .MonteCarlo import _checkerboard_batch
+
+
+class Schedule:
+    """
+    Temperature schedule of an annealing run
+
+    Subclasses implement `temperature`, which is called before every sweep
+    and may look at the current state of the restarts to adapt.
+    """
+
+    def __init__(self, T_start: float, T_end: float) -> None:
+        """
+        Parameters
+        ----------
+        T_start : float
+            Temperature of the first sweep
+        T_end : float
+            Temperature of the last sweep
+        """
+        self.T_start = T_start
+        self.T_end = T_end
+
+    def temperature(self, step: int, n_steps: int, energies: np.array, acceptance: float) -> float:
+        """
+        Parameters
+        ----------
+        step : int
+            Index of the sweep about to be done
+        n_steps : int
+            Total number of sweeps
+        energies : np.array
+            Current energy of each restart
+        acceptance : float
+            Fraction of flips accepted in the previous sweep
+
+        Returns
+        -------
+        T : float
+            Temperature of the sweep
+        """
+        raise NotImplementedError
+
+
+class GeometricSchedule(Schedule):
+    """
+    T decreases by the same factor at every sweep
+    """
+
+    def temperature(self, step: int, n_steps: int, energies: np.array, acceptance: float) -> float:
+        return self.T_start * (self.T_end / self.T_start)**(step / max(n_steps - 1, 1))
+
+
+class LinearSchedule(Schedule):
+    """
+    T decreases by the same amount at every sweep
+    """
+
+    def temperature(self, step: int, n_steps: int, energies: np.array, acceptance: float) -> float:
+        return self.T_start + (self.T_end - self.T_start) * step / max(n_steps - 1, 1)
+
+
+class AdaptiveSchedule(Schedule):
+    """
+    Cool slowly where the energy fluctuates a lot, as near a phase transition
+
+    Following Huang, Romeo and Sangiovanni-Vincentelli, the temperature is
+    multiplied by exp(-rate*T/sigma) after each sweep, with sigma the spread
+    of the energies of the restarts, and never by less than min_factor. When
+    the restarts agree (sigma = 0) the geometric factor is used. T does not
+    go below T_end.
+    """
+
+    def __init__(self, T_start: float, T_end: float, rate: float = 0.7, min_factor: float = 0.5) -> None:
+        """
+        Parameters
+        ----------
+        T_start : float
+            Temperature of the first sweep
+        T_end : float
+            Lowest temperature
+        rate : float
+            Cooling rate, smaller values cool more slowly
+        min_factor : float
+            Smallest factor T is multiplied by in one sweep
+        """
+        super().__init__(T_start, T_end)
+        self.rate = rate
+        self.min_factor = min_factor
+        self._T = None
+
+    def temperature(self, step: int, n_steps: int, energies: np.array, acceptance: float) -> float:
+        if step == 0 or self._T is None:
+            self._T = self.T_start
+            return self._T
+        sigma = np.std(energies)
+        if sigma > 0:
+            factor = max(self.min_factor, np.exp(-self.rate * self._T / sigma))
+        else:
+            factor = (self.T_end / self.T_start)**(1.0 / max(n_steps - 1, 1))
+        self._T = max(self._T * factor, self.T_end)
+        return self._T
+
+
+SCHEDULES = {"geometric": GeometricSchedule, "linear": LinearSchedule, "adaptive": AdaptiveSchedule}
+
+
+def simulated_annealing(hamiltonian: ham,
+                        n_sweeps: int = 1000,
+                        n_restarts: int = 16,
+                        schedule="geometric",
+                        T_start: float = None,
+                        T_end: float = None,
+                        patience: int = None,
+                        target_energy: float = None,
+                        rng: np.random.Generator = None,
+                        return_history: bool = False) -> tuple:
+    """
+    Search for the lowest energy configuration by simulated annealing
+
+    All the restarts are annealed together as the rows of one (restarts, N)
+    array, with the vectorized color class sweeps of `checkerboard_step`,
+    so the cost per sweep is a few NumPy calls whatever the number of
+    restarts, and systems of thousands of spins can be searched.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to minimize
+    n_sweeps : int
+        The largest number of sweeps
+    n_restarts : int
+        The number of independent runs from random configurations
+    schedule : str or Schedule
+        "geometric", "linear", "adaptive" or a `Schedule` instance
+    T_start : float
+        First temperature of a named schedule, by default twice the largest
+        local field so that nearly every flip is accepted
+    T_end : float
+        Last temperature of a named schedule, by default T_start/1000
+    patience : int
+        Stop when the best energy has not improved for this many sweeps
+    target_energy : float
+        Stop as soon as a configuration at or below this energy is found
+    rng : np.random.Generator
+        Source of the random numbers, the global np.random state if None
+    return_history : bool
+        Whether to also return the temperature and best energy of each sweep
+
+    Returns
+    -------
+    tuple
+        The best configuration found as a BitString and its energy, then
+        the (sweeps done, 2) array of temperatures and best energies if
+        return_history is True
+
+    Raises
+    ------
+    ValueError :
+        if the schedule is unknown
+    """
+    if isinstance(schedule, str):
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Unknown schedule {schedule}, use one of {list(SCHEDULES)}")
+        if T_start is None:
+            T_start = 2.0*hamiltonian.max_field()
+        if T_end is None:
+            T_end = 1e-3*T_start
+        schedule = SCHEDULES[schedule](T_start, T_end)
+
+    if rng is None:
+        configs = (np.random.random((n_restarts, hamiltonian.n)) < 0.5).astype(np.int8)
+    else:
+        configs = (rng.random((n_restarts, hamiltonian.n)) < 0.5).astype(np.int8)
+    energies = hamiltonian.energies(configs)[0]
+    best = int(np.argmin(energies))
+    best_config = configs[best].copy()
+    best_energy = energies[best]
+
+    history = []
+    acceptance = 1.0
+    since_improved = 0
+    for step in range(n_sweeps):
+        T = schedule.temperature(step, n_sweeps, energies, acceptance)
+        dE, acceptance = _checkerboard_batch(hamiltonian, configs, T, rng)
+        energies += dE
+
+        k = int(np.argmin(energies))
+        # compare with the exact energy, the running ones carry round-off
+        if energies[k] < best_energy - 1e-9:
+            best_config = configs[k].copy()
+            best_energy = hamiltonian.energies(best_config[None, :])[0][0]
+            since_improved = 0
+        else:
+            since_improved += 1
+        history.append((T, best_energy))
+        if target_energy is not None and best_energy <= target_energy:
+            break
+        if patience is not None and since_improved >= patience:
+            break
+
+    configuration = bs(hamiltonian.n)
+    configuration.set_config(best_config)
+    if return_history:
+        return configuration, best_energy, np.array(history)
+    return configuration, best_energy
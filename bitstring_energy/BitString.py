@@ -2,6 +2,78 @@ import math
 import numpy as np
 import random
 
+
+def int_to_bits(values, n: int) -> np.ndarray:
+    """
+    Convert integers into arrays of bits, most significant bit first
+
+    Works on a single int or a whole array of ints at once, with
+    bit-shift broadcasting when the values fit in 63 bits and through
+    np.unpackbits on the bytes of arbitrary-precision ints otherwise.
+
+    Parameters
+    ----------
+    values : int or np.array
+        Non-negative integer(s) to convert, only their lowest n bits are kept
+    n : int
+        Number of bits per integer
+
+    Returns
+    -------
+    bits : np.array
+        (n,) array of 0s and 1s for a single int, (len(values), n) otherwise
+    """
+    single = np.ndim(values) == 0
+    if single:
+        fits = 0 <= values < 2**63
+    else:
+        fits = np.asarray(values).dtype.kind in "iu"
+    if n <= 63 and fits:
+        shifts = np.arange(n - 1, -1, -1, dtype=np.int64)
+        bits = (np.asarray(values, dtype=np.int64)[..., None] >> shifts) & 1
+        return bits.astype(np.int8)
+
+    n_bytes = (n + 7) // 8
+    mask = (1 << n) - 1
+    values = [values] if single else list(values)
+    data = b''.join([(int(v) & mask).to_bytes(n_bytes, 'big') for v in values])
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8).reshape(len(values), n_bytes), axis=1)
+    bits = bits[:, 8*n_bytes - n:].view(np.int8)
+    if single:
+        return bits[0]
+    return bits
+
+
+def bits_to_int(bits: np.array):
+    """
+    Convert arrays of bits, most significant bit first, into integers
+
+    Parameters
+    ----------
+    bits : np.array
+        (n,) array of 0s and 1s, or (k, n) array of k bitstrings
+
+    Returns
+    -------
+    values : int or np.array
+        int for a single bitstring. For k bitstrings an int64 array when
+        n <= 63, otherwise an object array of Python ints.
+    """
+    bits = np.asarray(bits)
+    n = bits.shape[-1]
+    if n <= 63:
+        weights = np.left_shift(1, np.arange(n - 1, -1, -1, dtype=np.int64))
+        values = bits.astype(np.int64) @ weights
+        if bits.ndim == 1:
+            return int(values)
+        return values
+
+    padding = (-n) % 8
+    packed = np.packbits(bits.astype(np.uint8), axis=-1)
+    if bits.ndim == 1:
+        return int.from_bytes(packed.tobytes(), 'big') >> padding
+    return np.array([int.from_bytes(row.tobytes(), 'big') >> padding for row in packed], dtype=object)
+
 class BitString:
     """
     Simple class to implement a string of bits
@@ -102,6 +174,8 @@ class BitString:
         bool
             True if the two bitstrings are equal, False otherwise
         """
+        if isinstance(__o, PackedBitString):
+            return __o == self
         if isinstance(__o, BitString):
             for i in range(self.n):
                 if (self[i] != __o[i]):
@@ -124,9 +198,7 @@ class BitString:
         """
         Sets the bitstring to the given list of bits
         """
-        if (type(config) != np.ndarray):
-            config = np.array(config, dtype=int)
-        self.config = np.array(config, dtype=int)
+        self._assign(np.asarray(config))
 
     def set_config(self, config: np.array) -> None:
         """
@@ -165,10 +237,7 @@ class BitString:
         bit_to_int : int
             integer value of the bitstring
         """
-        bit_to_int = 0
-        for digit in self.config:
-            bit_to_int = (bit_to_int << 1) | int(digit)
-        return bit_to_int
+        return bits_to_int(self.config)
 
     def set_int_config(self, num: int, digits: int =None) -> None:
         """
@@ -183,10 +252,7 @@ class BitString:
         """
         if digits is None:
             digits = self.n
-        # the bin(num) gives a string of the form '0b*****'
-        # the [2:] removes the '0b' from the string
-        # the zfill(digits) adds 0s to the front of the string to make it the correct length
-        self.config = np.array([int(digit) for digit in bin(num)[2:].zfill(digits)], dtype=int)
+        self._assign(int_to_bits(num, digits))
 
     def return_array(self) -> np.array:
         """
@@ -208,7 +274,306 @@ class BitString:
         M   : Int, default: 0
             Total number of spin up sites 
         """
-        self.config = np.zeros(self.n, dtype=int) 
+        self._assign(np.zeros(self.n, dtype=int))
         random_list = random.sample(range(0, self.n), M)
         for i in random_list:
             self.config[i] = 1
+
+    def _assign(self, config: np.array) -> None:
+        """
+        Store new bits, in place when the length does not change so that a
+        bitstring viewing a row of a `BitStringArray` keeps writing into it
+        """
+        if (np.shape(config) == np.shape(self.config)):
+            self.config[:] = config
+        else:
+            self.config = np.array(config, dtype=int)
+
+    def pack(self):
+        """
+        Returns a copy of the bitstring packed 64 bits per word
+
+        Returns
+        -------
+        PackedBitString
+            bitstring with the same bits
+        """
+        packed = PackedBitString(self.n)
+        packed.set_config(self.config)
+        return packed
+
+
+# number of bits set in each byte value, for NumPy without bitwise_count
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+def _popcount(words: np.array) -> int:
+    """
+    Count the bits set in an array of unsigned words
+    """
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum())
+    return int(_BYTE_POPCOUNT[words.view(np.uint8)].sum())
+
+
+class PackedBitString:
+    """
+    String of bits packed 64 per uint64 word
+
+    Reads like a `BitString` with 1/64 of its memory, but `config` is a
+    read-only copy, so the samplers, which update `config` in place, need a
+    `BitString` (see `unpack`). Bit i is stored in word i // 64, most
+    significant bit first, so the words read in order are the binary digits
+    of `int()`.
+    """
+
+    def __init__(self, N: int =None) -> None:
+        """
+        Parameters
+        ----------
+        N : int
+            number of spins
+
+        Raises
+        ------
+        AttributeError :
+            if the number of spins is not defined
+        """
+        if (N == None):
+            raise AttributeError("Must define the number of spins")
+        self.n = N
+        self.words = np.zeros((N + 63) // 64, dtype=np.uint64)
+        self.n_dim = 2**self.n
+
+    def _position(self, index: int) -> tuple:
+        """
+        Word and bit mask of the bit at the given index
+        """
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError(f"index {index} is out of range for {self.n} bits")
+        return index // 64, np.uint64(1 << (63 - index % 64))
+
+    def __str__(self) -> str:
+        """
+        Prints out the bitstring
+
+        Returns
+        -------
+        bitString : str
+            string of bits
+        """
+        return ''.join([str(i) for i in self.config])
+
+    def __len__(self) -> int:
+        """
+        Returns
+        -------
+        length : int
+            number of bits in the bitstring
+        """
+        return self.n
+
+    def __getitem__(self, index: int) -> int:
+        """
+        Returns the bit at the given index
+
+        Parameters
+        ----------
+        index : int
+            index of the bit to return
+
+        Returns
+        -------
+        bit : int
+            bit at the given index
+        """
+        word, mask = self._position(index)
+        return int(self.words[word] & mask != 0)
+
+    def __setitem__(self, index: int, value: int) -> None:
+        """
+        Sets the bit at the given index
+
+        Parameters
+        ----------
+        index : int
+            index of the bit to set
+        value : int
+            value to set the bit to
+
+        Raises
+        ------
+        ValueError :
+            if the value is not 0 or 1
+        """
+        value = int(value)
+        if (value != 0 and value != 1):
+            raise ValueError("The value must be 0 or 1")
+        word, mask = self._position(index)
+        if value:
+            self.words[word] |= mask
+        else:
+            self.words[word] &= ~mask
+
+    def __eq__(self, __o: object) -> bool:
+        """
+        Checks if two bitstrings are equal, word by word
+
+        Parameters
+        ----------
+        __o : object
+            object to compare to
+
+        Returns
+        -------
+        bool
+            True if the two bitstrings are equal, False otherwise
+        """
+        if isinstance(__o, BitString):
+            __o = __o.pack()
+        if isinstance(__o, PackedBitString):
+            return self.n == __o.n and np.array_equal(self.words, __o.words)
+        return False
+
+    def __hash__(self) -> int:
+        """
+        Hash of the bits, do not modify a bitstring used as a dict key
+
+        Returns
+        -------
+        hash : int
+            hash of the number of bits and of the words
+        """
+        return hash((self.n, self.words.tobytes()))
+
+    def copy(self):
+        """
+        Returns
+        -------
+        PackedBitString
+            independent copy of the bitstring
+        """
+        packed = PackedBitString(self.n)
+        packed.words[:] = self.words
+        return packed
+
+    def flip(self, index: int) -> None:
+        """
+        Flips the bit at the given index
+
+        Parameters
+        ----------
+        index : int
+            index of the bit to flip
+        """
+        word, mask = self._position(index)
+        self.words[word] ^= mask
+
+    def set_config(self, config: np.array) -> None:
+        """
+        Sets the bitstring to the given list of bits
+        """
+        packed = np.packbits(np.asarray(config, dtype=np.uint8))
+        padded = np.zeros(8 * len(self.words), dtype=np.uint8)
+        padded[:len(packed)] = packed
+        self.words = padded.view('>u8').astype(np.uint64)
+
+    def set_string(self, config: np.array) -> None:
+        """
+        call set_config
+        """
+        self.set_config(config)
+
+    @property
+    def config(self) -> np.array:
+        """
+        The bits unpacked into an array of 0s and 1s
+
+        This is a read-only copy, so code that updates a configuration in
+        place fails instead of silently changing nothing.
+
+        Returns
+        -------
+        config : np.array
+            array of '0's and '1's
+        """
+        unpacked = np.unpackbits(self.words.astype('>u8').view(np.uint8), count=self.n).astype(int)
+        unpacked.setflags(write=False)
+        return unpacked
+
+    def return_array(self) -> np.array:
+        """
+        Returns the bitstring as a list of 0s and 1s
+
+        Returns
+        -------
+        list
+            list of '0's and '1's
+        """
+        return self.config
+
+    def on(self) -> int:
+        """
+        Returns the number of '1's in the bitstring
+
+        Returns
+        -------
+        on : int
+            number of '1's in the bitstring
+        """
+        return _popcount(self.words)
+
+    def off(self) -> int:
+        """
+        Returns the number of '0's in the bitstring
+
+        Returns
+        -------
+        off : int
+            number of '0's in the bitstring
+        """
+        return self.n - self.on()
+
+    def int(self) -> int:
+        """
+        Returns the integer value of the bitstring
+
+        Returns
+        -------
+        bit_to_int : int
+            integer value of the bitstring
+        """
+        padding = 64 * len(self.words) - self.n
+        return int.from_bytes(self.words.astype('>u8').tobytes(), 'big') >> padding
+
+    def set_int_config(self, num: int, digits: int =None) -> None:
+        """
+        Sets the bitstring to the given integer value
+
+        Parameters
+        ----------
+        num : int
+            integer value to set the bitstring to
+        digits : int
+            number of digits in the bitstring, must be the number of spins
+        """
+        if digits is not None and digits != self.n:
+            raise ValueError(f"A packed bitstring of {self.n} bits cannot hold {digits} digits")
+        padding = 64 * len(self.words) - self.n
+        data = (int(num) << padding).to_bytes(8 * len(self.words), 'big')
+        self.words = np.frombuffer(data, dtype='>u8').astype(np.uint64)
+
+    def unpack(self) -> BitString:
+        """
+        Returns a copy of the bitstring as a `BitString`
+
+        Returns
+        -------
+        BitString
+            bitstring with the same bits
+        """
+        unpacked = BitString(self.n)
+        unpacked.set_config(self.config)
+        return unpacked
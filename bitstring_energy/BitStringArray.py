@@ -0,0 +1,315 @@
+import numpy as np
+from .BitString import BitString, bits_to_int, int_to_bits
+
+
+class BitStringArray:
+    """
+    Columnar container for an ensemble of K bitstrings of N bits
+
+    All configurations live in one contiguous (K, N) int8 buffer, the layout
+    `IsingHamiltonian.energies` reads, and single rows are handed out as
+    zero-copy `BitString` views.
+    """
+
+    def __init__(self, K: int =None, N: int =None, configs: np.array =None) -> None:
+        """
+        Parameters
+        ----------
+        K : int
+            number of bitstrings, all set to 0
+        N : int
+            number of spins of each bitstring
+        configs : np.array
+            (K, N) array of 0s and 1s to store instead
+
+        Raises
+        ------
+        AttributeError :
+            if neither the configurations nor K and N are defined
+        """
+        if configs is not None:
+            self.configs = np.ascontiguousarray(np.atleast_2d(configs), dtype=np.int8)
+        elif K is None or N is None:
+            raise AttributeError("Must define the configurations or their number and number of spins")
+        else:
+            self.configs = np.zeros((K, N), dtype=np.int8)
+        self.n = self.configs.shape[1]
+
+    @classmethod
+    def from_ints(cls, values: np.array, N: int):
+        """
+        Build the array from the integer values of the bitstrings
+
+        Parameters
+        ----------
+        values : np.array
+            integer value of each bitstring
+        N : int
+            number of spins
+
+        Returns
+        -------
+        BitStringArray
+            one bitstring per value
+        """
+        return cls(configs=int_to_bits(np.asarray(values), N))
+
+    @classmethod
+    def from_bitstrings(cls, bitstrings: list):
+        """
+        Copy a list of `BitString` into one array
+
+        Parameters
+        ----------
+        bitstrings : list
+            bitstrings of the same length
+
+        Returns
+        -------
+        BitStringArray
+            one row per bitstring
+        """
+        return cls(configs=np.array([bs.config for bs in bitstrings]))
+
+    @classmethod
+    def from_packed(cls, packed: np.array, N: int):
+        """
+        Unpack the output of `pack`
+
+        Parameters
+        ----------
+        packed : np.array
+            (K, ceil(N/8)) array of bytes
+        N : int
+            number of spins
+
+        Returns
+        -------
+        BitStringArray
+            the unpacked bitstrings
+        """
+        return cls(configs=np.unpackbits(np.atleast_2d(packed), axis=1, count=N))
+
+    def __len__(self) -> int:
+        """
+        Returns
+        -------
+        length : int
+            number of bitstrings
+        """
+        return len(self.configs)
+
+    def __str__(self) -> str:
+        """
+        Returns
+        -------
+        bitStrings : str
+            one string of bits per line
+        """
+        return '\n'.join([''.join(map(str, row)) for row in self.configs.tolist()])
+
+    def __array__(self, dtype=None, copy=None) -> np.array:
+        """
+        The (K, N) buffer, so the array can be passed to NumPy functions
+        """
+        if dtype is None:
+            return self.configs
+        return self.configs.astype(dtype)
+
+    def __getitem__(self, index):
+        """
+        Returns a zero-copy view of one or more bitstrings
+
+        Parameters
+        ----------
+        index : int, slice or np.array
+            which bitstrings to return
+
+        Returns
+        -------
+        BitString or BitStringArray
+            a `BitString` writing into this array for an int index, a
+            `BitStringArray` otherwise (a view for slices, a copy for
+            index arrays, as in NumPy)
+        """
+        if np.ndim(index) == 0 and not isinstance(index, slice):
+            view = BitString(self.n)
+            view.config = self.configs[index]
+            return view
+        subset = BitStringArray.__new__(BitStringArray)
+        subset.configs = self.configs[index]
+        subset.n = self.n
+        return subset
+
+    def __setitem__(self, index: int, value) -> None:
+        """
+        Sets one or more bitstrings
+
+        Parameters
+        ----------
+        index : int, slice or np.array
+            which bitstrings to set
+        value : BitString, BitStringArray or np.array
+            new bits
+        """
+        if isinstance(value, BitString):
+            value = value.config
+        self.configs[index] = np.asarray(value)
+
+    def __iter__(self):
+        """
+        Iterates over zero-copy `BitString` views of the rows
+        """
+        for k in range(len(self)):
+            yield self[k]
+
+    def __eq__(self, __o: object) -> bool:
+        """
+        Checks if two arrays hold the same bitstrings in the same order
+
+        Parameters
+        ----------
+        __o : object
+            object to compare to
+
+        Returns
+        -------
+        bool
+            True if the two arrays are equal, False otherwise
+        """
+        if isinstance(__o, BitStringArray):
+            return np.array_equal(self.configs, __o.configs)
+        return False
+
+    def copy(self):
+        """
+        Returns
+        -------
+        BitStringArray
+            independent copy of the array
+        """
+        return BitStringArray(configs=self.configs.copy())
+
+    def on(self) -> np.array:
+        """
+        Returns the number of '1's in each bitstring
+
+        Returns
+        -------
+        on : np.array
+            number of '1's per bitstring
+        """
+        return self.configs.sum(axis=1, dtype=np.int64)
+
+    def off(self) -> np.array:
+        """
+        Returns the number of '0's in each bitstring
+
+        Returns
+        -------
+        off : np.array
+            number of '0's per bitstring
+        """
+        return self.n - self.on()
+
+    def int(self) -> np.array:
+        """
+        Returns the integer value of each bitstring
+
+        Returns
+        -------
+        values : np.array
+            int64 values, or Python ints in an object array beyond 63 bits
+        """
+        return bits_to_int(self.configs)
+
+    def flip(self, indices, rows=None) -> None:
+        """
+        Flips the bits at the given indices
+
+        Parameters
+        ----------
+        indices : int or np.array
+            indices of the bits to flip
+        rows : int or np.array
+            bitstrings to flip them in, all of them if None
+        """
+        indices = np.atleast_1d(indices)
+        if rows is None:
+            self.configs[:, indices] ^= 1
+        else:
+            self.configs[np.ix_(np.atleast_1d(rows), indices)] ^= 1
+
+    def hamming(self, other) -> np.array:
+        """
+        Hamming distances to a bitstring or between two arrays
+
+        Parameters
+        ----------
+        other : BitString, np.array or BitStringArray
+            a single bitstring, or L bitstrings
+
+        Returns
+        -------
+        distances : np.array
+            (K,) distances to a single bitstring, or the (K, L) matrix of
+            pairwise distances
+        """
+        if isinstance(other, BitString):
+            other = other.config
+        other = np.asarray(other)
+        if other.ndim == 1:
+            return (self.configs != other).sum(axis=1, dtype=np.int64)
+        # d(a, b) = a.(1 - b) + (1 - a).b, as two integer matrix products
+        a = self.configs.astype(np.int32)
+        b = other.astype(np.int32)
+        return a @ (1 - b).T + (1 - a) @ b.T
+
+    def argsort(self) -> np.array:
+        """
+        Returns the order that sorts the bitstrings by integer value
+
+        Returns
+        -------
+        order : np.array
+            indices of the bitstrings in increasing order
+        """
+        # lexsort uses the last key as the primary one
+        return np.lexsort(self.configs.T[::-1])
+
+    def sort(self) -> None:
+        """
+        Sorts the bitstrings by integer value, in place
+        """
+        self.configs[:] = self.configs[self.argsort()]
+
+    def unique(self, return_counts: bool =False):
+        """
+        Returns the distinct bitstrings, sorted by integer value
+
+        Parameters
+        ----------
+        return_counts : bool
+            whether to also return how many times each one occurs
+
+        Returns
+        -------
+        BitStringArray or tuple
+            the distinct bitstrings, and their counts if requested
+        """
+        result = np.unique(self.configs, axis=0, return_counts=return_counts)
+        if return_counts:
+            return BitStringArray(configs=result[0]), result[1]
+        return BitStringArray(configs=result)
+
+    def pack(self) -> np.array:
+        """
+        Returns the bitstrings packed 8 bits per byte
+
+        Returns
+        -------
+        packed : np.array
+            (K, ceil(N/8)) uint8 array, as read by `from_packed` and by
+            `IsingHamiltonian.energies` with packed=True
+        """
+        return np.packbits(self.configs, axis=1)
@@ -0,0 +1,220 @@
+"""Wolff and Swendsen-Wang cluster updates over the CSR couplings."""
+
+import numpy as np
+from .BitString import BitString as bs
+from .Energy import IsingHamiltonian as ham
+
+
+def _random(rng: np.random.Generator, size) -> np.array:
+    """
+    Uniform numbers from rng, or from the global np.random state if None
+    """
+    if rng is None:
+        return np.random.random(size)
+    return rng.random(size)
+
+
+def _bond_probability(w: np.array, T: float) -> np.array:
+    """
+    Probability 1 - exp(-2|w|/T) of activating a satisfied bond of coupling w
+    """
+    return -np.expm1(-2.0*np.abs(w)/T)
+
+
+def _neighbor_positions(hamiltonian: ham, sites: np.array) -> tuple:
+    """
+    Positions in the CSR arrays of the neighbors of some sites, and the
+    site each position belongs to
+    """
+    starts = hamiltonian.indptr[sites]
+    counts = hamiltonian.indptr[sites + 1] - starts
+    offsets = np.cumsum(counts) - counts
+    positions = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+    return positions, np.repeat(sites, counts)
+
+
+def _find_roots(parent: np.array) -> np.array:
+    """
+    Compress every path of the union-find forest to point at its root
+    """
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+def _union(parent: np.array, u: np.array, v: np.array) -> np.array:
+    """
+    Merge the sets joined by the bonds (u, v), hooking the larger root
+    under the smaller one and compressing, until every bond is inside a set
+
+    Returns the root of every element.
+    """
+    parent = _find_roots(parent)
+    while True:
+        ru, rv = parent[u], parent[v]
+        split = ru != rv
+        if not np.any(split):
+            return parent
+        # roots only ever point at smaller indices, so no cycle can form
+        np.minimum.at(parent, np.maximum(ru[split], rv[split]), np.minimum(ru[split], rv[split]))
+        parent = _find_roots(parent)
+
+
+def wolff_step(hamiltonian: ham,
+               configuration: bs,
+               T: float,
+               rng: np.random.Generator = None,
+               n_clusters: int = 1) -> bs:
+    """
+    Taking a single step of Wolff cluster updates
+
+    Each cluster is grown from a random site and flipped. A bond is added to
+    the cluster with probability
+    1 - exp(-2|J_ij|/T) when it is satisfied (J_ij s_i s_j < 0), which is
+    exact for any couplings and efficient for ferromagnetic ones (J_ij < 0).
+    The field acts through a ghost spin fixed to +1 with couplings mu_i, and
+    a cluster bonded to the ghost is not flipped.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    configuration : BitString
+        The initial configuration of the system
+    T : float
+        The temperature of the system
+    rng : np.random.Generator
+        Source of the random numbers, the global np.random state if None
+    n_clusters : int
+        The number of clusters to flip. It must not depend on the sizes of
+        the clusters, stopping once they cover N sites would bias the samples.
+
+    Returns
+    -------
+    BitString
+        The new configuration of the system
+    """
+    _wolff_step(hamiltonian, configuration, T, rng, n_clusters)
+    return configuration
+
+
+def _wolff_step(hamiltonian: ham, configuration: bs, T: float,
+                rng: np.random.Generator = None, n_clusters: int = 1) -> tuple:
+    """
+    One step of `wolff_step`, returning the change of the energy and of
+    the magnetization
+    """
+    dE = 0.0
+    dM = 0
+    for k in range(n_clusters):
+        delta_e, delta_m = _wolff_cluster(hamiltonian, configuration, T, rng)
+        dE += delta_e
+        dM += delta_m
+    return dE, dM
+
+
+def _wolff_cluster(hamiltonian: ham, configuration: bs, T: float,
+                   rng: np.random.Generator = None) -> tuple:
+    """
+    Grow one Wolff cluster from a random site and flip it
+
+    Returns the change of the energy and of the magnetization.
+    """
+    spins = 2*configuration.config.astype(np.int64) - 1
+    seed = min(int(_random(rng, None) * configuration.n), configuration.n - 1)
+    in_cluster = np.zeros(configuration.n, dtype=bool)
+    in_cluster[seed] = True
+    frontier = np.array([seed], dtype=np.int64)
+    while len(frontier) > 0:
+        # bonds to the ghost spin: the cluster would flip the field, reject it
+        ghost = (hamiltonian.mu[frontier] * spins[frontier] < 0) & \
+                (_random(rng, len(frontier)) < _bond_probability(hamiltonian.mu[frontier], T))
+        if np.any(ghost):
+            return 0.0, 0
+
+        positions, sites = _neighbor_positions(hamiltonian, frontier)
+        neighbors = hamiltonian.indices[positions]
+        w = hamiltonian.weights[positions]
+        grow = (~in_cluster[neighbors]) & (w * spins[sites] * spins[neighbors] < 0)
+        grow[grow] = _random(rng, int(grow.sum())) < _bond_probability(w[grow], T)
+        frontier = np.unique(neighbors[grow])
+        in_cluster[frontier] = True
+
+    cluster = np.flatnonzero(in_cluster)
+    positions, sites = _neighbor_positions(hamiltonian, cluster)
+    neighbors = hamiltonian.indices[positions]
+    boundary = ~in_cluster[neighbors]
+    # only the field and the bonds leaving the cluster change sign
+    boundary_e = (hamiltonian.weights[positions[boundary]] * spins[sites[boundary]]
+                  * spins[neighbors[boundary]]).sum()
+    dE = -2.0*(hamiltonian.mu[cluster] @ spins[cluster] + boundary_e)
+    dM = -2*int(spins[cluster].sum())
+    configuration.config[cluster] = 1 - configuration.config[cluster]
+    return dE, dM
+
+
+def swendsen_wang_step(hamiltonian: ham,
+                       configuration: bs,
+                       T: float,
+                       rng: np.random.Generator = None) -> bs:
+    """
+    Taking a single Swendsen-Wang sweep
+
+    Every satisfied bond (J_ij s_i s_j < 0) is activated with probability
+    1 - exp(-2|J_ij|/T), the clusters of active bonds are found with a
+    union-find over the edges, and each cluster is flipped with probability
+    1/2. The field acts through a ghost spin fixed to +1 with couplings
+    mu_i, and the cluster holding the ghost is never flipped.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    configuration : BitString
+        The initial configuration of the system
+    T : float
+        The temperature of the system
+    rng : np.random.Generator
+        Source of the random numbers, the global np.random state if None
+
+    Returns
+    -------
+    BitString
+        The new configuration of the system
+    """
+    _swendsen_wang_step(hamiltonian, configuration, T, rng)
+    return configuration
+
+
+def _swendsen_wang_step(hamiltonian: ham, configuration: bs, T: float,
+                        rng: np.random.Generator = None) -> tuple:
+    """
+    One sweep of `swendsen_wang_step`, returning the change of the energy
+    and of the magnetization
+    """
+    n = configuration.n
+    spins = 2*configuration.config.astype(np.int64) - 1
+    src, dst, w = hamiltonian.edges()
+    bond_e = w * spins[src] * spins[dst]
+    active = (src != dst) & (bond_e < 0)
+    active[active] = _random(rng, int(active.sum())) < _bond_probability(w[active], T)
+
+    # the ghost spin is element n
+    field_e = hamiltonian.mu * spins
+    ghost = (field_e < 0) & (_random(rng, n) < _bond_probability(hamiltonian.mu, T))
+    u = np.concatenate([src[active], np.flatnonzero(ghost)])
+    v = np.concatenate([dst[active], np.full(int(ghost.sum()), n, dtype=np.int64)])
+    roots = _union(np.arange(n + 1, dtype=np.int64), u, v)
+
+    coins = _random(rng, n + 1) < 0.5
+    coins[roots[n]] = False
+    flip = coins[roots[:n]]
+
+    # bonds with exactly one flipped end change sign
+    cut = flip[src] != flip[dst]
+    dE = -2.0*(bond_e[cut].sum() + field_e[flip].sum())
+    dM = -2*int(spins[flip].sum())
+    configuration.config[flip] = 1 - configuration.config[flip]
+    return dE, dM
@@ -1,17 +1,33 @@
 """Provide the primary functions."""
 
-import math
 import numpy as np
-import networkx as nx
-import matplotlib.pyplot as plt
 from .BitString import BitString
 
+# Number of configurations scored together by IsingHamiltonian.energies
+_ENERGY_BATCH = 1024
+
+# Largest number of distinct positive energy changes stored in an
+# acceptance table, beyond that the couplings are treated as continuous.
+MAX_TABLE_SIZE = 4096
+
+# Number of temperatures whose acceptance tables are kept
+_MAX_CACHED_TABLES = 64
+
+
+def _row_sum(terms: np.array) -> np.array:
+    """
+    Sequential sum of each row of a 2D array
+    """
+    if (terms.shape[1] == 0):
+        return np.zeros(len(terms))
+    return np.add.accumulate(terms, axis=1)[:, -1]
 
 class IsingHamiltonian:
     def __init__(self, J:np.array, mu:np.array) -> None:
         """
         Initialize the Ising Hamiltonian
-        Convert the J array into a matrix 
+        Convert the J array into compressed sparse row (CSR) arrays
+
         Parameters
         ----------
         J : np.array
@@ -19,21 +35,180 @@ class IsingHamiltonian:
         mu : np.array
             Magnetic field that acts on each spin
         """
-        self.J = J
-        self.mu = mu
-        J_matrix = np.zeros((len(J), len(J)))
-        for row_i in range(len(J)):
-            # row_i : int
-            for col_i in range(row_i, len(J)):
-                # col_i : int
-                if (row_i == col_i):
-                    J_matrix[row_i][col_i] = mu[row_i]
-                else:
-                    for neighbor in J[row_i]:
-                        if (neighbor[0] == col_i):
-                            J_matrix[row_i][col_i] = neighbor[1]
-        self.J_matrix = J_matrix
+        # CSR layout: the neighbors of site i are indices[indptr[i]:indptr[i+1]]
+        # with couplings weights[indptr[i]:indptr[i+1]], built in O(edges)
+        indptr = np.zeros(len(J) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(neighbors) for neighbors in J])
+        indices = np.array([neighbor[0] for neighbors in J for neighbor in neighbors], dtype=np.int64)
+        weights = np.array([neighbor[1] for neighbors in J for neighbor in neighbors], dtype=float)
+        self._set_couplings(indptr, indices, weights, mu)
+        self._J = J
+
+    def _set_couplings(self, indptr: np.array, indices: np.array, weights: np.array, mu: np.array) -> None:
+        """
+        Store the CSR couplings and the fields, and reset the cached values
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.mu = np.asarray(mu, dtype=float)
+        self.n = len(indptr) - 1
+
+        # every coupling once (j >= i), the terms the energy sums over
+        rows = np.repeat(np.arange(self.n, dtype=np.int64), np.diff(self.indptr))
+        upper = self.indices >= rows
+        self._edges = (rows[upper], self.indices[upper], self.weights[upper])
+        self._J = None
+        self._J_matrix = None
+        self._coloring = None
+        self._quantum = None
+        self._tables = {}
+
+    @classmethod
+    def from_edges(cls, src: np.array, dst: np.array, w, mu, n: int = None):
+        """
+        Build the Hamiltonian from arrays of edges, in O(edges) NumPy operations
+
+        Parameters
+        ----------
+        src : np.array
+            First site of each edge
+        dst : np.array
+            Second site of each edge, every edge is listed once
+        w : float or np.array
+            Coupling of each edge, or one coupling for all of them
+        mu : float or np.array
+            Magnetic field of each site, or one field for all of them
+        n : int
+            Number of sites, len(mu) by default, or one more than the
+            largest site of an edge when mu is a single value
+
+        Returns
+        -------
+        IsingHamiltonian
+            The Hamiltonian with these couplings
+
+        Raises
+        ------
+        ValueError :
+            if an edge joins a site to itself or a site is out of range
+        """
+        src = np.asarray(src, dtype=np.int64).ravel()
+        dst = np.asarray(dst, dtype=np.int64).ravel()
+        w = np.broadcast_to(np.asarray(w, dtype=float), src.shape)
+        if (n is None):
+            if (np.ndim(mu) > 0):
+                n = len(mu)
+            else:
+                n = int(max(src.max(initial=-1), dst.max(initial=-1))) + 1
+        mu = np.broadcast_to(np.asarray(mu, dtype=float), (n,)).copy()
+        if (np.any(src == dst)):
+            raise ValueError("Edges must join two different sites")
+        if (len(src) > 0 and (min(src.min(), dst.min()) < 0 or max(src.max(), dst.max()) >= n)):
+            raise ValueError(f"Edges must join sites between 0 and {n - 1}")
+
+        # each edge is a neighbor of both of its sites
+        rows = np.concatenate([src, dst])
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=n))
+        indices = np.concatenate([dst, src])[order]
+        weights = np.concatenate([w, w])[order]
+
+        hamiltonian = cls.__new__(cls)
+        hamiltonian._set_couplings(indptr, indices, weights, mu)
+        return hamiltonian
+
+    @classmethod
+    def from_networkx(cls, G, mu=0.0, weight: str = "weight", default: float = 1.0):
+        """
+        Build the Hamiltonian of a networkx graph
+
+        Site i is the i-th node of G.nodes(), so graphs labelled 0 to N-1
+        keep their labels.
+
+        Parameters
+        ----------
+        G : nx.Graph
+            Graph of the couplings
+        mu : float or np.array
+            Magnetic field of each site, in the order of G.nodes()
+        weight : str
+            Edge attribute holding the coupling
+        default : float
+            Coupling of the edges without that attribute
+
+        Returns
+        -------
+        IsingHamiltonian
+            The Hamiltonian with the couplings of the graph
+        """
+        nodes = list(G.nodes())
+        n = len(nodes)
+        data = list(G.edges(data=weight, default=default))
+        if (nodes == list(range(n))):
+            src = np.array([e[0] for e in data], dtype=np.int64)
+            dst = np.array([e[1] for e in data], dtype=np.int64)
+        else:
+            site = {node: i for i, node in enumerate(nodes)}
+            src = np.array([site[e[0]] for e in data], dtype=np.int64)
+            dst = np.array([site[e[1]] for e in data], dtype=np.int64)
+        w = np.array([e[2] for e in data], dtype=float)
+        return cls.from_edges(src, dst, w, mu, n=n)
+
+    @property
+    def J(self) -> list:
+        """
+        Couplings as a list, for each site, of (neighbor, coupling) pairs
+
+        Built from the CSR arrays the first time it is used when the
+        Hamiltonian was not created from such a list.
+
+        Returns
+        -------
+        J : list
+            Coupling constants of each site
+        """
+        if self._J is None:
+            weights = self.weights.tolist()
+            indices = self.indices.tolist()
+            indptr = self.indptr.tolist()
+            self._J = [list(zip(indices[indptr[i]:indptr[i + 1]], weights[indptr[i]:indptr[i + 1]]))
+                       for i in range(self.n)]
+        return self._J
 
+    @property
+    def J_matrix(self) -> np.array:
+        """
+        Dense (N, N) matrix with the fields on the diagonal and the
+        couplings in the upper triangle
+
+        It needs O(N^2) memory, so it is only built the first time it is used.
+
+        Returns
+        -------
+        J_matrix : np.array
+            Dense coupling matrix
+        """
+        if self._J_matrix is None:
+            src, dst, w = self._edges
+            off_diagonal = src != dst
+            J_matrix = np.zeros((self.n, self.n))
+            J_matrix[src[off_diagonal], dst[off_diagonal]] = w[off_diagonal]
+            J_matrix[np.diag_indices(self.n)] = self.mu
+            self._J_matrix = J_matrix
+        return self._J_matrix
+
+    def edges(self) -> tuple:
+        """
+        Returns every coupling once, as the sites i <= j and their weight
+
+        Returns
+        -------
+        (src, dst, w) : tuple
+            Arrays of the first site, second site and coupling of each edge
+        """
+        return self._edges
 
     # def energy(self, bs: BitString, G: nx.Graph) -> float:
     #     """
@@ -76,66 +251,324 @@ N
         -------
         energy : float
             Energy of the configuration
+
+        Raises
+        ------
+        ValueError :
+            if the configuration does not have one spin per site
         """
 
         # convert bit string such that for 0 -> -1 and 1 -> 1
-        bitString = (np.array(bs.config) * 2) - 1
-
-        # J: [[(1, 1.0), (2, 1.0)], [(0, 1.0), (2, 1.0)], [(0, 1.0), (1, 1.0)]]
-        energy = np.dot(self.mu, bitString)
-        for i in range(bs.n):
-            for neighbor in self.J[i]:
-                if (neighbor[0] < i):
-                    continue
-                energy += neighbor[1] * bitString[neighbor[0]] * bitString[i]
-        return energy
-    
+        bitString = (np.asarray(bs.config, dtype=float)[None, :] * 2) - 1
+        if (bitString.shape[1] != self.n):
+            raise ValueError(f"The configuration has {bitString.shape[1]} spins, the Hamiltonian {self.n}")
+
+        src, dst, w = self._edges
+        if (bs.n < self.n):
+            # bs.n lags behind a longer array given to set_config: as the
+            # original loop over range(bs.n), only the couplings from the
+            # first bs.n sites to any later site are summed
+            keep = src < bs.n
+            src, dst, w = src[keep], dst[keep], w[keep]
+        energy, _ = self._spin_energies(bitString, src, dst, w)
+        return energy[0]
+
+    def energies(self, configs: np.array, packed: bool = False) -> tuple:
+        """
+        Compute the energy and magnetization of many configurations at once
+
+        Gives exactly the same values as `energy` and `compute_energy_and_mag`
+        called on each configuration.
 
-        # take the dot product of the J matrix and the bitstring
-        # return bitString.T @ self.J_matrix @ bitString
+        Parameters
+        ----------
+        configs : np.array
+            (batch, N) array of 0s and 1s (any integer or bool dtype), or with
+            `packed` the (batch, ceil(N/8)) uint8 output of `np.packbits`
+        packed : bool
+            Whether the configurations are packed eight bits per byte
+
+        Returns
+        -------
+        (E, M) : tuple
+            Arrays with the energy and magnetization of each configuration
+        """
+        configs = np.atleast_2d(np.asarray(configs))
+        if packed:
+            configs = np.unpackbits(configs, axis=-1, count=self.n)
+        E = np.empty(len(configs))
+        M = np.empty(len(configs))
+        src, dst, w = self._edges
+        # bound the (rows, edges) temporaries for large batches
+        for start in range(0, len(configs), _ENERGY_BATCH):
+            stop = start + _ENERGY_BATCH
+            spins = (configs[start:stop].astype(float) * 2) - 1
+            E[start:stop], M[start:stop] = self._spin_energies(spins, src, dst, w)
+        return (E, M)
+
+    def _spin_energies(self, spins: np.array, src: np.array, dst: np.array, w: np.array) -> tuple:
+        """
+        Energies and magnetizations of a (batch, N) matrix of -1/+1 spins
+
+        The terms are accumulated strictly left to right, so that a row gets
+        the same rounding whatever the size of the batch it is evaluated in.
+        """
+        E = _row_sum(spins * self.mu) + _row_sum(spins[:, src] * spins[:, dst] * w)
+        M = spins.sum(axis=1)
+        return (E, M)
     
-    def compute_average_values(self, bs: BitString, temp: float) -> tuple:
+    def local_field(self, config: np.array, site: int) -> float:
+        """
+        Compute the local field acting on a site
+
+            .. math::
+                h_i = \\mu_i + \\sum_j J_{ij} s_j
+
+        Flipping the spin s_i changes the energy by -2 s_i h_i.
+
+        Parameters
+        ----------
+        config : np.array
+            Configuration of 0s and 1s, either a single one of shape (N,)
+            or a batch of shape (batch, N)
+        site : int
+            Index of the site
+
+        Returns
+        -------
+        field : float or np.array
+            Local field, one value per configuration in the batch
+        """
+        start, stop = self.indptr[site], self.indptr[site + 1]
+        spins = 2.0*config[..., self.indices[start:stop]] - 1.0
+        return self.mu[site] + spins @ self.weights[start:stop]
+
+    def local_fields(self, config: np.array, sites: np.array) -> np.array:
+        """
+        Compute the local fields acting on many sites at once
+
+        Parameters
+        ----------
+        config : np.array
+            Configuration of 0s and 1s, either a single one of shape (N,)
+            or a batch of shape (batch, N)
+        sites : np.array
+            Indices of the sites
+
+        Returns
+        -------
+        fields : np.array
+            Local field of each site, of shape (len(sites),) or
+            (batch, len(sites))
+        """
+        sites = np.asarray(sites, dtype=np.int64)
+        starts = self.indptr[sites]
+        counts = self.indptr[sites + 1] - starts
+        offsets = np.zeros(len(sites) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        # positions of the neighbors of all the sites in the CSR arrays
+        positions = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+
+        terms = (2.0*config[..., self.indices[positions]] - 1.0) * self.weights[positions]
+        # a trailing zero keeps every segment start a valid index for reduceat
+        terms = np.concatenate([terms, np.zeros(terms.shape[:-1] + (1,))], axis=-1)
+        couplings = np.add.reduceat(terms, offsets[:-1], axis=-1)
+        return self.mu[sites] + np.where(counts > 0, couplings, 0.0)
+
+    def coloring(self) -> list:
+        """
+        Greedily color the coupling graph into independent sets
+
+        Sites are colored in order of decreasing degree with the smallest
+        color not used by a neighbor, so no two sites of a color class are
+        coupled. On bipartite lattices this gives the checkerboard.
+
+        Returns
+        -------
+        classes : list
+            Arrays with the sites of each color class
+        """
+        if self._coloring is None:
+            indptr = self.indptr.tolist()
+            indices = self.indices.tolist()
+            colors = [-1] * self.n
+            order = np.argsort(-np.diff(self.indptr), kind="stable")
+            for site in order.tolist():
+                taken = {colors[j] for j in indices[indptr[site]:indptr[site + 1]] if j != site}
+                color = 0
+                while color in taken:
+                    color += 1
+                colors[site] = color
+            colors = np.array(colors, dtype=np.int64)
+            self._coloring = [np.flatnonzero(colors == c) for c in range(colors.max(initial=-1) + 1)]
+        return self._coloring
+
+    def max_field(self) -> float:
+        """
+        Largest possible absolute local field over all the sites
+
+        Returns
+        -------
+        field : float
+            Bound on |h_i|, half the largest possible energy change of a flip
+        """
+        rows = np.repeat(np.arange(self.n), np.diff(self.indptr))
+        couplings = np.bincount(rows, weights=np.abs(self.weights), minlength=self.n)
+        return float(np.max(np.abs(self.mu) + couplings, initial=0.0))
+
+    def energy_quantum(self) -> float:
+        """
+        Find q such that every coupling and field is an integer multiple of q
+
+        Energy changes of single flips are then 2*q times an integer, so they
+        take at most max_field/q + 1 distinct positive values.
+
+        Returns
+        -------
+        quantum : float
+            The largest such q with at most 6 decimals, or 0 when there is no
+            q giving a table of at most MAX_TABLE_SIZE entries
+        """
+        if self._quantum is None:
+            values = np.abs(np.concatenate([self.weights, self.mu]))
+            values = values[values > 0]
+            quantum = 0.0
+            for decimals in range(7):
+                scaled = values * 10**decimals
+                if np.allclose(scaled, np.rint(scaled), rtol=0, atol=1e-9):
+                    quantum = float(np.gcd.reduce(np.rint(scaled).astype(np.int64), initial=0)) / 10**decimals
+                    break
+            if (quantum > 0 and self.max_field() / quantum > MAX_TABLE_SIZE):
+                quantum = 0.0
+            self._quantum = quantum
+        return self._quantum
+
+    def acceptance_table(self, T: float) -> tuple:
+        """
+        Tabulate the Metropolis acceptance probability of every distinct
+        energy change, cached per temperature
+
+        Parameters
+        ----------
+        T : float
+            The temperature of the system
+
+        Returns
+        -------
+        (table, quantum) : tuple
+            table[k] is exp(-2*quantum*k/T), the probability of accepting an
+            energy change of 2*quantum*k. The table is empty and quantum is 0
+            for continuous couplings.
+        """
+        table = self._tables.get(T)
+        if table is None:
+            quantum = self.energy_quantum()
+            if (quantum == 0):
+                table = np.zeros(0)
+            else:
+                n_levels = int(round(self.max_field() / quantum)) + 1
+                table = np.exp(-2.0*quantum*np.arange(n_levels) / T)
+            if (len(self._tables) >= _MAX_CACHED_TABLES):
+                self._tables.clear()
+            self._tables[T] = table
+        return table, self._quantum
+
+    def acceptance_probability(self, delta_e: np.array, T: float) -> np.array:
+        """
+        Metropolis acceptance probability min(1, exp(-delta_e/T)) of energy
+        changes, read from `acceptance_table` when the couplings are discrete
+
+        Parameters
+        ----------
+        delta_e : np.array
+            Energy changes of single spin flips
+        T : float
+            The temperature of the system
+
+        Returns
+        -------
+        probability : np.array
+            Acceptance probability of each energy change
+        """
+        table, quantum = self.acceptance_table(T)
+        uphill = np.maximum(delta_e, 0.0)
+        if (quantum == 0):
+            return np.exp(-uphill/T)
+        return table[np.rint(uphill / (2.0*quantum)).astype(np.int64)]
+
+    def compute_average_values(self, bs: BitString, temp: float, method: str = "auto") -> tuple:
         """
         Compute the average values of the 
         Energy, Magnetization, Heat Capacity, and Magnetic Susceptibility
 
+        All 2**N states are enumerated exactly in NumPy blocks, see
+        `Enumeration.exact_average_values`, unless the couplings have a small
+        bandwidth, as chains and narrow strips do, where the transfer
+        matrices of `TransferMatrix` give the same values in O(N).
+
         Parameters
         ----------
         bs : BitString
             Input bitstring
         temp : float
             Temperature of the system
+        method : str
+            "transfer", enumeration order "gray" or "vectorized", or "auto"
+            to use the transfer matrices when they are cheaper than "gray"
         """
+        if (method == "auto"):
+            method = self._solver(bs.n)
+        if (method == "transfer"):
+            from .TransferMatrix import TransferMatrix
+            return TransferMatrix(self).average_values(temp)
+        from .Enumeration import exact_average_values
+        return exact_average_values(self, bs.n, temp, method=method)
 
-        E = 0
-        M = 0
-        EE = 0
-        MM = 0
-        Z = 0
-
-        for b in range(0, 2**bs.n):
-            bs.set_int_config(b, digits=bs.n)
-            Ei, Mi = self.compute_energy_and_mag(bs, temp)
-            Zi = np.exp(-Ei/temp)
-            E += Ei * Zi
+    def compute_average_values_sweep(self, temps: np.array, cache: str = None,
+                                     method: str = "auto") -> tuple:
+        """
+        Compute the average values of the
+        Energy, Magnetization, Heat Capacity, and Magnetic Susceptibility
+        for many temperatures with a single enumeration of the states
 
-            # Ei = self.energy(bs)
-            # Mi = np.sum(2*bs.config - 1)
-            M += Mi * Zi
+        The states are enumerated once into an (E, M) density of states,
+        see `Enumeration.DensityOfStates`, and every temperature is then
+        evaluated from that histogram. With the transfer matrices nothing is
+        enumerated or cached.
 
-            EE += Ei**2 * Zi
-            MM += Mi**2 * Zi
+        Parameters
+        ----------
+        temps : np.array
+            Temperatures of the system
+        cache : str
+            Optional .npz file used to store and reuse the density of states
+        method : str
+            "transfer", enumeration order "gray" or "vectorized", or "auto",
+            see `compute_average_values`
 
-            Z += Zi
-        
-        E /= Z
-        M /= Z
-        EE /= Z
-        MM /= Z
+        Returns
+        -------
+        (E, M, HC, MS) : tuple
+            Arrays of averages, one value per temperature
+        """
+        if (method == "auto"):
+            method = self._solver(self.n)
+        if (method == "transfer"):
+            from .TransferMatrix import TransferMatrix
+            return TransferMatrix(self).average_values(np.atleast_1d(temps))
+        from .Enumeration import density_of_states
+        dos = density_of_states(self, self.n, cache=cache, method=method)
+        return dos.average_values(temps)
 
-        HC = (EE - E**2) / temp**2
-        MS = (MM - M**2) / temp
-        return (E, M, HC, MS)
+    def _solver(self, n: int) -> str:
+        """
+        "transfer" when the transfer matrices solve the n spins faster than
+        the enumeration of their 2**n states, "gray" otherwise
+        """
+        from .TransferMatrix import transfer_matrix_cost
+        if (n == self.n and np.log2(transfer_matrix_cost(self)) < n):
+            return "transfer"
+        return "gray"
 
     def compute_energy_and_mag(self, bs: BitString, temp: float) -> tuple:
         """
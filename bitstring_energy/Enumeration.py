@@ -0,0 +1,591 @@
+"""Exact enumeration of every configuration of an Ising Hamiltonian."""
+
+import hashlib
+import heapq
+import os
+import numpy as np
+from .BitString import int_to_bits
+from .Energy import IsingHamiltonian as ham
+
+# Number of states handled per NumPy block. Each block needs a
+# (chunk_size, N) spin matrix, so 2**14 keeps the working set to a few MB.
+DEFAULT_CHUNK_SIZE = 2**14
+
+# Number of low-order spins enumerated together by the Gray-code walk,
+# the remaining high-order spins are walked one flip at a time.
+DEFAULT_BLOCK_BITS = 14
+
+
+def unpack_range(start: int, stop: int, n: int) -> np.ndarray:
+    """
+    Convert the integers start, ..., stop-1 into rows of bits
+
+    The bit order matches `BitString.set_int_config`: column 0 holds the
+    most significant bit.
+
+    Parameters
+    ----------
+    start : int
+        First integer of the range
+    stop : int
+        One past the last integer of the range
+    n : int
+        Number of bits per row
+
+    Returns
+    -------
+    bits : np.array
+        (stop - start, n) array of 0s and 1s
+    """
+    return int_to_bits(np.arange(start, stop, dtype=np.int64), n)
+
+
+def coupling_matrix(hamiltonian: ham, n: int) -> np.ndarray:
+    """
+    Build the upper triangular coupling matrix U used by the block energies
+
+    Every coupling of `IsingHamiltonian.edges` is added to U[i, j], which is
+    exactly the set of terms `IsingHamiltonian.energy` sums over.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to enumerate
+    n : int
+        Number of spins
+
+    Returns
+    -------
+    U : np.array
+        (n, n) upper triangular coupling matrix
+    """
+    src, dst, w = hamiltonian.edges()
+    U = np.zeros((n, n))
+    np.add.at(U, (src, dst), w)
+    return U
+
+
+def _spin_energies(spins: np.array, U: np.array, mu: np.array) -> tuple:
+    """
+    Energies and magnetizations of a (batch, N) matrix of -1/+1 spins
+    """
+    E = np.einsum('ij,ij->i', spins @ U, spins) + spins @ mu
+    M = spins.sum(axis=1)
+    return E, M
+
+
+def energy_blocks(hamiltonian: ham, n: int, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Generate the energy and magnetization of all 2**n states in blocks
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to enumerate
+    n : int
+        Number of spins
+    chunk_size : int
+        Number of states per block
+
+    Yields
+    ------
+    (E, M) : tuple
+        Arrays with the energy and magnetization of the states
+        start, ..., start + chunk_size - 1, in increasing order
+    """
+    U = coupling_matrix(hamiltonian, n)
+    mu = np.asarray(hamiltonian.mu, dtype=float)
+    n_states = 2**n
+    for start in range(0, n_states, chunk_size):
+        spins = 2.0*unpack_range(start, min(start + chunk_size, n_states), n) - 1.0
+        yield _spin_energies(spins, U, mu)
+
+
+def gray_code_blocks(hamiltonian: ham, n: int, block_bits: int = DEFAULT_BLOCK_BITS):
+    """
+    Generate the energy and magnetization of all 2**n states in Gray-code order
+
+    The last `block_bits` sites (the least significant bits) form a block
+    of 2**block_bits configurations that is evaluated once. The remaining
+    sites are then walked in Gray-code order, so that each step flips
+    exactly one spin for the whole block and the energies are updated from
+    the local field of that spin, at O(degree) cost per state.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to enumerate
+    n : int
+        Number of spins
+    block_bits : int
+        Number of low-order spins handled as one vectorized block
+
+    Yields
+    ------
+    (E, M) : tuple
+        Arrays with the energy and magnetization of 2**block_bits states
+    """
+    block_bits = min(n, block_bits)
+    n_top = n - block_bits
+
+    # first block: high-order spins all 0
+    configs = np.zeros((2**block_bits, n), dtype=np.int8)
+    configs[:, n_top:] = unpack_range(0, 2**block_bits, block_bits)
+    mu = np.asarray(hamiltonian.mu, dtype=float)
+    E, M = _spin_energies(2.0*configs - 1.0, coupling_matrix(hamiltonian, n), mu)
+    yield E.copy(), M.copy()
+
+    for k in range(1, 2**n_top):
+        # the Gray code k ^ (k >> 1) differs from the previous one in the
+        # lowest set bit of k, bit 0 being the last high-order site
+        site = n_top - 1 - ((k & -k).bit_length() - 1)
+        del_si = 2
+        if configs[0, site] == 1:
+            del_si = -2
+        E += hamiltonian.local_field(configs, site) * del_si
+        M += del_si
+        configs[:, site] ^= 1
+        yield E.copy(), M.copy()
+
+
+class BoltzmannAverager:
+    """
+    Streaming Boltzmann averages of the energy and magnetization
+
+    The weights are kept relative to the largest -E/T seen so far
+    (log-sum-exp), so the partition function never overflows, no matter
+    how low the temperature is.
+    """
+
+    def __init__(self, temp: float) -> None:
+        """
+        Parameters
+        ----------
+        temp : float
+            Temperature of the system
+        """
+        self.temp = temp
+        self.shift = -np.inf
+        self.Z = 0.0
+        self.E = 0.0
+        self.M = 0.0
+        self.EE = 0.0
+        self.MM = 0.0
+
+    def add(self, E: np.array, M: np.array) -> None:
+        """
+        Add a block of states to the running sums
+
+        Parameters
+        ----------
+        E : np.array
+            Energies of the states
+        M : np.array
+            Magnetizations of the states
+        """
+        log_w = -np.asarray(E, dtype=float) / self.temp
+        top = log_w.max()
+        if (top > self.shift):
+            scale = np.exp(self.shift - top)
+            self.Z *= scale
+            self.E *= scale
+            self.M *= scale
+            self.EE *= scale
+            self.MM *= scale
+            self.shift = top
+        w = np.exp(log_w - self.shift)
+        self.Z += w.sum()
+        self.E += w @ E
+        self.M += w @ M
+        self.EE += w @ (E*E)
+        self.MM += w @ (M*M)
+
+    def averages(self) -> tuple:
+        """
+        Returns
+        -------
+        (E, M, HC, MS) : tuple
+            Average energy, magnetization, heat capacity and
+            magnetic susceptibility
+        """
+        E = self.E / self.Z
+        M = self.M / self.Z
+        EE = self.EE / self.Z
+        MM = self.MM / self.Z
+        HC = (EE - E**2) / self.temp**2
+        MS = (MM - M**2) / self.temp
+        return (E, M, HC, MS)
+
+
+def exact_average_values(hamiltonian: ham, n: int, temp: float,
+                         method: str = "gray",
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple:
+    """
+    Compute the exact average values of the
+    Energy, Magnetization, Heat Capacity, and Magnetic Susceptibility
+    by enumerating all 2**n states in NumPy blocks
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to enumerate
+    n : int
+        Number of spins
+    temp : float
+        Temperature of the system
+    method : str
+        "gray" for the incremental Gray-code walk (`gray_code_blocks`), or
+        "vectorized" to evaluate every state from scratch (`energy_blocks`)
+    chunk_size : int
+        Number of states per block
+
+    Returns
+    -------
+    (E, M, HC, MS) : tuple
+        Average energy, magnetization, heat capacity and
+        magnetic susceptibility
+
+    Raises
+    ------
+    ValueError :
+        if the method is not known
+    """
+    averager = BoltzmannAverager(temp)
+    for E, M in _blocks(hamiltonian, n, method, chunk_size):
+        averager.add(E, M)
+    return averager.averages()
+
+
+def hamiltonian_fingerprint(hamiltonian: ham, n: int) -> str:
+    """
+    Hash of the couplings and fields, used to validate cached results
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian
+    n : int
+        Number of spins
+
+    Returns
+    -------
+    fingerprint : str
+        Hex digest identifying the Hamiltonian
+    """
+    digest = hashlib.sha256()
+    digest.update(np.int64(n).tobytes())
+    digest.update(coupling_matrix(hamiltonian, n).tobytes())
+    digest.update(np.asarray(hamiltonian.mu, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def _histogram(energies: np.array, magnetizations: np.array, counts: np.array) -> tuple:
+    """
+    Sum the counts of equal (E, M) pairs
+
+    Returns
+    -------
+    (energies, magnetizations, counts) : tuple
+        Distinct pairs sorted by energy then magnetization, and their counts
+    """
+    order = np.lexsort((magnetizations, energies))
+    energies, magnetizations = energies[order], magnetizations[order]
+    starts = np.flatnonzero(np.concatenate([[True], (np.diff(energies) != 0) | (np.diff(magnetizations) != 0)]))
+    return energies[starts], magnetizations[starts], np.add.reduceat(counts[order], starts)
+
+
+class DensityOfStates:
+    """
+    Degeneracies of the distinct (E, M) pairs of an Ising Hamiltonian
+
+    Once built, the thermal averages at any number of temperatures are
+    evaluated from the histogram alone, without enumerating the states again.
+    """
+
+    def __init__(self, energies: np.array, magnetizations: np.array,
+                 counts: np.array, fingerprint: str = "") -> None:
+        """
+        Parameters
+        ----------
+        energies : np.array
+            Energy of each (E, M) level
+        magnetizations : np.array
+            Magnetization of each (E, M) level
+        counts : np.array
+            Number of states in each (E, M) level
+        fingerprint : str
+            Fingerprint of the Hamiltonian the histogram was built from
+        """
+        self.energies = np.asarray(energies, dtype=float)
+        self.magnetizations = np.asarray(magnetizations, dtype=float)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.fingerprint = fingerprint
+
+    def __len__(self) -> int:
+        """
+        Returns
+        -------
+        length : int
+            number of distinct (E, M) levels
+        """
+        return len(self.counts)
+
+    @classmethod
+    def from_hamiltonian(cls, hamiltonian: ham, n: int, method: str = "gray",
+                         chunk_size: int = DEFAULT_CHUNK_SIZE, decimals: int = 10):
+        """
+        Enumerate all 2**n states once and histogram their (E, M) values
+
+        Parameters
+        ----------
+        hamiltonian : IsingHamiltonian
+            The Ising Hamiltonian to enumerate
+        n : int
+            Number of spins
+        method : str
+            Enumeration method, see `exact_average_values`
+        chunk_size : int
+            Number of states per block
+        decimals : int
+            Energies are rounded to this many decimals before being binned,
+            so that round-off does not split a level in two
+
+        Returns
+        -------
+        dos : DensityOfStates
+            The histogram of the Hamiltonian
+        """
+        # histogram every block on its own, then merge them all at once, so
+        # that the build stays linear when nearly every level is distinct
+        parts = [_histogram(np.round(E, decimals), np.asarray(M, dtype=float), np.ones(len(E), dtype=np.int64))
+                 for E, M in _blocks(hamiltonian, n, method, chunk_size)]
+        energies, magnetizations, counts = _histogram(*(np.concatenate(part) for part in zip(*parts)))
+        return cls(energies, magnetizations, counts,
+                   fingerprint=hamiltonian_fingerprint(hamiltonian, n))
+
+    def average_values(self, temps: np.array) -> tuple:
+        """
+        Compute the average values of the
+        Energy, Magnetization, Heat Capacity, and Magnetic Susceptibility
+        for all the temperatures at once
+
+        Parameters
+        ----------
+        temps : np.array
+            Temperatures of the system
+
+        Returns
+        -------
+        (E, M, HC, MS) : tuple
+            Arrays of averages, one value per temperature
+        """
+        temps = np.atleast_1d(np.asarray(temps, dtype=float))
+        log_w = np.log(self.counts)[None, :] - self.energies[None, :] / temps[:, None]
+        w = np.exp(log_w - log_w.max(axis=1, keepdims=True))
+        Z = w.sum(axis=1)
+        E = w @ self.energies / Z
+        M = w @ self.magnetizations / Z
+        EE = w @ self.energies**2 / Z
+        MM = w @ self.magnetizations**2 / Z
+        HC = (EE - E**2) / temps**2
+        MS = (MM - M**2) / temps
+        return (E, M, HC, MS)
+
+    def energy_levels(self) -> tuple:
+        """
+        The sorted energy spectrum, with the magnetizations summed out
+
+        Returns
+        -------
+        (energies, counts) : tuple
+            Distinct energies in increasing order and their degeneracies
+        """
+        energies, inverse = np.unique(self.energies, return_inverse=True)
+        return energies, np.bincount(inverse.ravel(), weights=self.counts).astype(np.int64)
+
+    def save(self, path: str) -> None:
+        """
+        Save the histogram to a .npz file
+
+        Parameters
+        ----------
+        path : str
+            File to write
+        """
+        with open(path, "wb") as f:
+            np.savez(f, energies=self.energies, magnetizations=self.magnetizations,
+                     counts=self.counts, fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a histogram written by `save`
+
+        Parameters
+        ----------
+        path : str
+            File to read
+
+        Returns
+        -------
+        dos : DensityOfStates
+            The stored histogram
+        """
+        with np.load(path) as data:
+            return cls(data["energies"], data["magnetizations"], data["counts"],
+                       fingerprint=str(data["fingerprint"]))
+
+
+def density_of_states(hamiltonian: ham, n: int, cache: str = None,
+                      method: str = "gray") -> DensityOfStates:
+    """
+    Build the (E, M) density of states, reusing a cached copy when possible
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to enumerate
+    n : int
+        Number of spins
+    cache : str
+        Optional .npz file. If it holds the histogram of this Hamiltonian it
+        is loaded, otherwise the histogram is computed and written to it.
+    method : str
+        Enumeration method, see `exact_average_values`
+
+    Returns
+    -------
+    dos : DensityOfStates
+        The histogram of the Hamiltonian
+    """
+    if (cache is not None and os.path.exists(cache)):
+        dos = DensityOfStates.load(cache)
+        if (dos.fingerprint == hamiltonian_fingerprint(hamiltonian, n)):
+            return dos
+    dos = DensityOfStates.from_hamiltonian(hamiltonian, n, method=method)
+    if (cache is not None):
+        dos.save(cache)
+    return dos
+
+
+def lowest_states(hamiltonian: ham, n: int, k: int, method: str = "gray",
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, decimals: int = 10) -> tuple:
+    """
+    Find the k lowest energy states by streaming over all 2**n states
+
+    Only the k best states are kept, in a heap, so the memory does not
+    depend on n. Each block is first cut down, with np.partition, to the
+    states at or below its k-th lowest energy, and only the states not above
+    the worst one kept so far reach the heap.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to enumerate
+    n : int
+        Number of spins
+    k : int
+        Number of states to keep
+    method : str
+        Enumeration method, see `exact_average_values`
+    chunk_size : int
+        Number of states per block
+    decimals : int
+        Energies are rounded to this many decimals, so that round-off does
+        not change the order of degenerate states
+
+    Returns
+    -------
+    (states, energies) : tuple
+        Integer values of the states, as `BitString.int`, and their
+        rounded energies, in increasing order of energy then of state.
+        Both are empty when k <= 0.
+        `BitStringArray.from_ints(states, n)` gives the configurations.
+    """
+    if (k <= 0):
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    # max-heap of the k best (E, state) pairs, stored negated
+    heap = []
+    for start, (E, M) in zip(_block_starts(n, method, chunk_size), _blocks(hamiltonian, n, method, chunk_size)):
+        E = np.round(E, decimals)
+        candidates = np.arange(len(E))
+        if (len(E) > k):
+            # every state tied with the k-th lowest, the heap breaks the ties by state
+            candidates = np.flatnonzero(E <= np.partition(E, k - 1)[k - 1])
+        if (len(heap) == k):
+            candidates = candidates[E[candidates] <= -heap[0][0]]
+        for index in candidates.tolist():
+            item = (-float(E[index]), -(start + index))
+            if (len(heap) < k):
+                heapq.heappush(heap, item)
+            elif (item > heap[0]):
+                heapq.heapreplace(heap, item)
+    best = sorted((-e, -state) for e, state in heap)
+    states = np.array([state for e, state in best], dtype=np.int64)
+    energies = np.array([e for e, state in best], dtype=float)
+    return states, energies
+
+
+def energy_spectrum(hamiltonian: ham, n: int, path: str = None, method: str = "gray",
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.array:
+    """
+    Energy of every state, as a float32 array indexed by the state integer
+
+    With a path, the array is a memory-mapped .npy file filled block by
+    block, so the memory stays bounded whatever n is (2**32 states take
+    16 GB of disk). It can be opened again with np.load(path, mmap_mode="r").
+    The sorted levels with their degeneracies are given in far less space
+    by `DensityOfStates.energy_levels`.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to enumerate
+    n : int
+        Number of spins
+    path : str
+        .npy file to write, or None to build the array in memory
+    method : str
+        Enumeration method, see `exact_average_values`
+    chunk_size : int
+        Number of states per block
+
+    Returns
+    -------
+    spectrum : np.array
+        spectrum[state] is the energy of the state `BitString.int` = state
+    """
+    if (path is None):
+        spectrum = np.empty(2**n, dtype=np.float32)
+    else:
+        spectrum = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(2**n,))
+    for start, (E, M) in zip(_block_starts(n, method, chunk_size), _blocks(hamiltonian, n, method, chunk_size)):
+        spectrum[start:start + len(E)] = E
+    if (path is not None):
+        spectrum.flush()
+    return spectrum
+
+
+def _block_starts(n: int, method: str, chunk_size: int):
+    """
+    Integer value of the first state of each block of `_blocks`, the
+    states of a block being consecutive integers
+    """
+    if (method == "gray"):
+        block_bits = min(n, int(chunk_size).bit_length() - 1)
+        # block k holds the high-order bits of the Gray code k ^ (k >> 1)
+        for k in range(2**(n - block_bits)):
+            yield (k ^ (k >> 1)) << block_bits
+    else:
+        yield from range(0, 2**n, chunk_size)
+
+
+def _blocks(hamiltonian: ham, n: int, method: str, chunk_size: int):
+    """
+    Select the block generator for the given enumeration method
+    """
+    if (method == "gray"):
+        return gray_code_blocks(hamiltonian, n, block_bits=int(chunk_size).bit_length() - 1)
+    if (method == "vectorized"):
+        return energy_blocks(hamiltonian, n, chunk_size)
+    raise ValueError(f"Unknown enumeration method {method}")
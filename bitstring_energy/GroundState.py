@@ -0,0 +1,275 @@
+"""Exact ground states by depth-first branch and bound."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .BitString import BitString as bs
+from .Energy import IsingHamiltonian as ham
+from ._optional import optional_import
+from .Kernels import available_backends
+
+
+def _search(indptr, indices, weights, mu, rest, prefix, best, eps, best_spins):
+    """
+    Depth-first search over the spins 0..N-1, in order, below a fixed prefix
+
+    Written so that the same code runs as plain Python and under numba.
+    `field[u]` is mu_u plus the couplings of site u to the assigned sites, so
+    assigning s_d adds field[d]*s_d to the energy, and the energy of any
+    completion is at least energy - sum(|field[u]|) - rest[d] over the
+    unassigned sites u, rest[d] being the sum of |J| over the couplings
+    between the sites d..N-1. Subtrees whose bound is above best + eps are
+    pruned, so all the ground states are reached and counted.
+
+    Returns the lowest energy and its degeneracy, and writes the first
+    configuration found at that energy into best_spins. The count is 0 when
+    no configuration is at or below best + eps.
+    """
+    n = len(mu)
+    start = len(prefix)
+    spins = np.zeros(n, dtype=np.int64)
+    field = mu.copy()
+    energy = np.zeros(n + 1)
+    state = np.zeros(n + 1, dtype=np.int64)
+    count = 0
+
+    # fixed prefix
+    for d in range(start):
+        s = prefix[d]
+        spins[d] = s
+        energy[d + 1] = energy[d] + field[d] * s
+        for k in range(indptr[d], indptr[d + 1]):
+            if indices[k] > d:
+                field[indices[k]] += weights[k] * s
+    if start == n:
+        if energy[n] <= best + eps:
+            best_spins[:] = spins
+            return energy[n], 1
+        return best, 0
+    absum = 0.0
+    for u in range(start, n):
+        absum += abs(field[u])
+
+    d = start
+    while d >= start:
+        if spins[d] != 0:
+            # undo the previous choice at this depth
+            s = spins[d]
+            spins[d] = 0
+            for k in range(indptr[d], indptr[d + 1]):
+                u = indices[k]
+                if u > d:
+                    absum -= abs(field[u])
+                    field[u] -= weights[k] * s
+                    absum += abs(field[u])
+            absum += abs(field[d])
+        if state[d] == 2:
+            d -= 1
+            continue
+        # try first the spin that lowers the energy
+        s = -1 if field[d] > 0 else 1
+        if state[d] == 1:
+            s = -s
+        state[d] += 1
+
+        spins[d] = s
+        absum -= abs(field[d])
+        for k in range(indptr[d], indptr[d + 1]):
+            u = indices[k]
+            if u > d:
+                absum -= abs(field[u])
+                field[u] += weights[k] * s
+                absum += abs(field[u])
+        e = energy[d] + field[d] * s
+        if e - absum - rest[d + 1] > best + eps:
+            continue
+        if d == n - 1:
+            if count == 0 or e < best - eps:
+                best = e
+                count = 1
+                best_spins[:] = spins
+            else:
+                count += 1
+            continue
+        energy[d + 1] = e
+        d += 1
+        state[d] = 0
+    return best, count
+
+
+_compiled_search = None
+
+
+def _compiled_kernel():
+    """
+    Compile the search with numba the first time it is needed
+    """
+    global _compiled_search
+    if _compiled_search is None:
+        numba = optional_import("numba", "fast")
+        _compiled_search = numba.njit(cache=True)(_search)
+    return _compiled_search
+
+
+def search_order(hamiltonian: ham) -> np.array:
+    """
+    Order the sites so that each one is coupled to many of the previous ones
+
+    Starting from the site of largest degree, the next site is the one with
+    the largest total |J| to the sites already ordered, ties going to the
+    larger degree. The couplings of a site are then known early, which
+    tightens the bounds of `ground_state`.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian
+
+    Returns
+    -------
+    order : np.array
+        order[d] is the site assigned at depth d
+    """
+    degree = np.diff(hamiltonian.indptr)
+    strength = np.abs(hamiltonian.weights)
+    placed = np.zeros(hamiltonian.n, dtype=bool)
+    links = np.zeros(hamiltonian.n)
+    order = []
+    for d in range(hamiltonian.n):
+        # links dominate, the degree only breaks ties
+        score = np.where(placed, -np.inf, links + 1e-6*degree)
+        site = int(np.argmax(score))
+        order.append(site)
+        placed[site] = True
+        start, stop = hamiltonian.indptr[site], hamiltonian.indptr[site + 1]
+        links[hamiltonian.indices[start:stop]] += strength[start:stop]
+    return np.array(order, dtype=np.int64)
+
+
+def _relabel(hamiltonian: ham, order: np.array) -> tuple:
+    """
+    CSR couplings, fields and remaining coupling bounds with site order[d]
+    renamed d
+    """
+    position = np.empty(hamiltonian.n, dtype=np.int64)
+    position[order] = np.arange(hamiltonian.n)
+    src, dst, w = hamiltonian.edges()
+    keep = src != dst
+    relabelled = ham.from_edges(position[src[keep]], position[dst[keep]], w[keep], hamiltonian.mu[order])
+    # rest[d]: sum of |J| over the couplings between sites d..N-1
+    low = np.minimum(position[src[keep]], position[dst[keep]])
+    rest = np.cumsum(np.bincount(low, weights=np.abs(w[keep]), minlength=hamiltonian.n + 1)[::-1])[::-1]
+    # couplings of a site to itself only shift the energy
+    shift = w[~keep].sum()
+    return relabelled.indptr, relabelled.indices, relabelled.weights, relabelled.mu, rest, shift
+
+
+def _run_search(arrays: tuple, prefix: np.array, best: float, eps: float, backend: str) -> tuple:
+    """
+    Search below one prefix, returning the lowest energy, its degeneracy and
+    the configuration in the search order
+    """
+    indptr, indices, weights, mu, rest = arrays
+    best_spins = np.zeros(len(mu), dtype=np.int64)
+    search = _compiled_kernel() if backend == "numba" else _search
+    energy, count = search(indptr, indices, weights, mu, rest, prefix, best, eps, best_spins)
+    return energy, count, best_spins
+
+
+def ground_state(hamiltonian: ham,
+                 n_workers: int = 1,
+                 prefix_bits: int = None,
+                 upper_bound: float = None,
+                 backend: str = "auto") -> tuple:
+    """
+    Find a provably optimal configuration and the number of ground states
+
+    The spins are assigned depth first in `search_order`, trying first the
+    value favored by the local field, and a subtree is pruned when the
+    energy of its assigned spins minus the largest possible gain of the
+    unassigned fields and couplings is above the best energy found. Without
+    a field the search only covers half of the states, flipping every spin
+    giving the other ground states.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian to minimize
+    n_workers : int
+        Number of worker processes, os.cpu_count() if None. With more than
+        one, the tree is split into 2**prefix_bits subtrees searched in
+        parallel.
+    prefix_bits : int
+        Number of leading spins fixed per subtree, by default enough for
+        about 8 subtrees per worker
+    upper_bound : float
+        Energy of a known configuration, which prunes the search from the
+        start; a short `simulated_annealing` run is used by default
+    backend : str
+        "numba", "python" or "auto" (numba when it is installed)
+
+    Returns
+    -------
+    tuple
+        A ground state as a BitString, the ground state energy and the
+        number of ground states
+
+    Raises
+    ------
+    ValueError :
+        if the backend is not available, or if upper_bound is below the
+        ground state energy
+    """
+    if backend == "auto":
+        backend = available_backends()[0]
+    if backend not in available_backends():
+        raise ValueError(f"Backend {backend} is not available, use one of {available_backends()}")
+
+    n = hamiltonian.n
+    order = search_order(hamiltonian)
+    indptr, indices, weights, mu, rest, shift = _relabel(hamiltonian, order)
+    arrays = (indptr, indices, weights, mu, rest)
+    eps = 1e-9 * (1.0 + np.abs(weights).sum() + np.abs(mu).sum())
+    if upper_bound is None:
+        from .Annealing import simulated_annealing
+        upper_bound = simulated_annealing(hamiltonian, n_sweeps=100, n_restarts=8,
+                                          rng=np.random.default_rng(0))[1]
+    best = upper_bound - shift + eps
+
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if prefix_bits is None:
+        prefix_bits = 0 if n_workers <= 1 else int(np.ceil(np.log2(8 * n_workers)))
+    # with no field, fixing the first spin to -1 halves the search
+    symmetric = not np.any(mu)
+    first = 1 if symmetric else 0
+    prefix_bits = min(max(prefix_bits, first), n)
+    free = prefix_bits - first
+    prefixes = 2*((np.arange(2**free)[:, None] >> np.arange(free)[::-1]) & 1) - 1
+    prefixes = np.hstack([-np.ones((2**free, first), dtype=np.int64), prefixes]).astype(np.int64)
+
+    tasks = [(arrays, prefix, best, eps, backend) for prefix in prefixes]
+    if n_workers <= 1:
+        results = [_run_search(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_run_search, *zip(*tasks)))
+
+    energy = min(result[0] for result in results)
+    count = 0
+    spins = None
+    for result_energy, result_count, result_spins in results:
+        if result_count > 0 and result_energy <= energy + eps:
+            count += result_count
+            if spins is None:
+                spins = result_spins
+    if spins is None:
+        raise ValueError(f"No configuration has an energy below the upper bound {upper_bound}")
+    if symmetric:
+        count *= 2
+
+    configuration = bs(n)
+    config = np.zeros(n, dtype=np.int64)
+    config[order] = (spins + 1) // 2
+    configuration.set_config(config)
+    return configuration, hamiltonian.energy(configuration), count
@@ -0,0 +1,160 @@
+"""Whole-sweep Metropolis kernels over the CSR couplings, compiled when possible."""
+
+import importlib.util
+import math
+import numpy as np
+from .BitString import BitString as bs
+from .Energy import IsingHamiltonian as ham
+from ._optional import optional_import
+
+
+def _metropolis_sweeps(config, indptr, indices, weights, mu, rand, table, quantum, beta, dE, dM):
+    """
+    Run len(rand) Metropolis sweeps over all the sites, in place
+
+    Written so that the same code runs as plain Python and under numba.
+    A move that raises the energy by delta_e > 0 is accepted when the
+    uniform number drawn for it is not larger than table[delta_e/(2*quantum)],
+    or exp(-beta*delta_e) when there is no table.
+    """
+    n = len(config)
+    for sweep in range(len(rand)):
+        sweep_e = 0.0
+        sweep_m = 0
+        for site_i in range(n):
+            field = mu[site_i]
+            for k in range(indptr[site_i], indptr[site_i + 1]):
+                field += weights[k] * (2.0*config[indices[k]] - 1.0)
+            del_si = 2
+            if config[site_i] == 1:
+                del_si = -2
+            delta_e = field * del_si
+            if delta_e > 0.0:
+                if len(table) > 0:
+                    accept_prob = table[int(round(delta_e / (2.0*quantum)))]
+                else:
+                    accept_prob = math.exp(-beta*delta_e)
+                if rand[sweep][site_i] > accept_prob:
+                    continue
+            config[site_i] = 1 - config[site_i]
+            sweep_e += delta_e
+            sweep_m += del_si
+        dE[sweep] = sweep_e
+        dM[sweep] = sweep_m
+
+
+_compiled_sweeps = None
+
+
+def _compiled_kernel():
+    """
+    Compile the sweep kernel with numba the first time it is needed, so
+    that importing the package does not import numba
+    """
+    global _compiled_sweeps
+    if _compiled_sweeps is None:
+        numba = optional_import("numba", "fast")
+        _compiled_sweeps = numba.njit(cache=True)(_metropolis_sweeps)
+    return _compiled_sweeps
+
+
+def available_backends() -> list:
+    """
+    Returns the kernel backends that can run here
+
+    Returns
+    -------
+    backends : list
+        "numba" when numba is installed, and always "python", the plain
+        Python loop
+    """
+    if importlib.util.find_spec("numba") is not None:
+        return ["numba", "python"]
+    return ["python"]
+
+
+def acceptance_table(hamiltonian: ham, T: float) -> tuple:
+    """
+    Tabulate the Metropolis acceptance probability of every distinct
+    energy change of the Hamiltonian, see `IsingHamiltonian.acceptance_table`
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    T : float
+        The temperature of the system
+
+    Returns
+    -------
+    (table, quantum) : tuple
+        table[k] is exp(-2*quantum*k/T), the probability of accepting an
+        energy change of 2*quantum*k. The table is empty and quantum is 0
+        for continuous couplings.
+    """
+    return hamiltonian.acceptance_table(T)
+
+
+def metropolis_sweep(hamiltonian: ham,
+                     configuration: bs,
+                     T: float,
+                     n_sweeps: int = 1,
+                     rng: np.random.Generator = None,
+                     backend: str = "auto") -> tuple:
+    """
+    Run whole Metropolis sweeps with a compiled or pure Python kernel
+
+    The uniform numbers are drawn up front, one per site and sweep, so every
+    backend produces the same trajectory for the same random stream.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    configuration : BitString
+        The configuration of the system, updated in place
+    T : float
+        The temperature of the system
+    n_sweeps : int
+        The number of sweeps to perform
+    rng : np.random.Generator
+        Source of the uniform numbers, the global np.random state if None
+    backend : str
+        "numba", "python" or "auto" (numba when it is installed)
+
+    Returns
+    -------
+    (dE, dM) : tuple
+        Arrays with the change of energy and magnetization of each sweep
+
+    Raises
+    ------
+    ValueError :
+        if the backend is not available
+    """
+    if backend == "auto":
+        backend = available_backends()[0]
+    if backend not in available_backends():
+        raise ValueError(f"Backend {backend} is not available, use one of {available_backends()}")
+
+    if rng is None:
+        rand = np.random.random((n_sweeps, configuration.n))
+    else:
+        rand = rng.random((n_sweeps, configuration.n))
+    table, quantum = acceptance_table(hamiltonian, T)
+    dE = np.zeros(n_sweeps)
+    dM = np.zeros(n_sweeps, dtype=np.int64)
+
+    if backend == "numba":
+        config = np.ascontiguousarray(configuration.config, dtype=np.int64)
+        _compiled_kernel()(config, hamiltonian.indptr, hamiltonian.indices, hamiltonian.weights,
+                          hamiltonian.mu, rand, table, quantum, 1.0/T, dE, dM)
+        configuration.config[:] = config
+    else:
+        # plain lists index much faster than arrays from Python
+        config = configuration.config.tolist()
+        _metropolis_sweeps(config, hamiltonian.indptr.tolist(), hamiltonian.indices.tolist(),
+                           hamiltonian.weights.tolist(), hamiltonian.mu.tolist(), rand.tolist(),
+                           table.tolist(), quantum, 1.0/T, dE, dM)
+        configuration.config[:] = config
+    return dE, dM
@@ -0,0 +1,68 @@
+"""Couplings of periodic hypercubic lattices, built without Python loops."""
+
+import numpy as np
+from .Energy import IsingHamiltonian as ham
+
+
+def hypercubic_edges(shape: tuple, periodic: bool = True) -> tuple:
+    """
+    Nearest neighbor bonds of a hypercubic lattice
+
+    Sites are numbered in row-major (C) order, as np.ravel_multi_index.
+    A periodic dimension of length 2 has a single bond between its two
+    sites, and one of length 1 has none, so no edge is listed twice.
+
+    Parameters
+    ----------
+    shape : tuple
+        Length of each dimension, e.g. (L,), (L, L) or (L, L, L)
+    periodic : bool
+        Whether the lattice wraps around in every dimension
+
+    Returns
+    -------
+    (src, dst) : tuple
+        Arrays with the two sites of each bond
+    """
+    shape = tuple(int(length) for length in np.atleast_1d(shape))
+    sites = np.arange(int(np.prod(shape)), dtype=np.int64).reshape(shape)
+    src, dst = [], []
+    for axis, length in enumerate(shape):
+        if (periodic and length > 2):
+            src.append(sites.ravel())
+            dst.append(np.roll(sites, -1, axis=axis).ravel())
+        else:
+            # open bonds along this axis: every site but the last layer
+            stop = [slice(None)] * len(shape)
+            stop[axis] = slice(0, length - 1)
+            start = [slice(None)] * len(shape)
+            start[axis] = slice(1, length)
+            src.append(sites[tuple(stop)].ravel())
+            dst.append(sites[tuple(start)].ravel())
+    return np.concatenate(src), np.concatenate(dst)
+
+
+def hypercubic_lattice(shape: tuple, J: float = 1.0, mu=0.0, periodic: bool = True) -> ham:
+    """
+    Ising Hamiltonian of a hypercubic lattice with uniform couplings
+
+    Parameters
+    ----------
+    shape : tuple
+        Length of each dimension, e.g. (L,) for a ring, (L, L) for a square
+        lattice or (L, L, L) for a cubic lattice
+    J : float
+        Coupling of every bond, positive values are antiferromagnetic
+    mu : float or np.array
+        Magnetic field, one value for all the sites or one per site
+    periodic : bool
+        Whether the lattice wraps around in every dimension
+
+    Returns
+    -------
+    IsingHamiltonian
+        The lattice Hamiltonian
+    """
+    src, dst = hypercubic_edges(shape, periodic=periodic)
+    n = int(np.prod(np.atleast_1d(shape)))
+    return ham.from_edges(src, dst, J, mu, n=n)
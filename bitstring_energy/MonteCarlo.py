@@ -2,12 +2,21 @@
 
 from .BitString import BitString as bs
 from .Energy import IsingHamiltonian as ham
+from .Kernels import metropolis_sweep
+from .Cluster import _wolff_step, _swendsen_wang_step
+from .Statistics import BlockingMoments
+from .Trajectory import TrajectoryWriter
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
 def metropolis_montecarlo(hamiltonian: ham,
                           configuration: bs,
                           T: int, nsweep: int,
-                          nburn: int) -> tuple:
+                          nburn: int,
+                          backend: str = None,
+                          rng: np.random.Generator = None,
+                          recompute_every: int = 0,
+                          trajectory: TrajectoryWriter = None) -> tuple:
     """
     This function performs the Metropolis Monte Carlo algorithm to sample the
     energy and magnetization of a given Ising Hamiltonian.
@@ -24,39 +33,395 @@ def metropolis_montecarlo(hamiltonian: ham,
         The number of sweeps to perform
     number_burn : int
         The number of sweeps to burn
+    backend : str
+        Sweep kernel from `Kernels.metropolis_sweep` ("numba", "python" or
+        "auto"), "checkerboard" for `checkerboard_step`, "wolff" or
+        "swendsen_wang" for the cluster updates of `Cluster`, or None to use
+        `metropolis_step`
+    rng : np.random.Generator
+        Source of the random numbers, the global np.random state if None
+    recompute_every : int
+        E and M are updated from the energy change of each accepted flip.
+        If non-zero, they are recomputed from scratch every
+        `recompute_every` sweeps to remove any accumulated round-off.
+    trajectory : TrajectoryWriter
+        If given, every measured configuration is appended to it with its
+        energy and magnetization
 
     Returns
     -------
     tuple
         The energy, magnetization, energy squared, and magnetization squared
+        running averages. `Statistics.samples_from_running_means` recovers
+        the samples for `Statistics.error_analysis`.
     """
     for j in range(nburn):
-        configuration = metropolis_step(hamiltonian, configuration, T)
+        _sweep(hamiltonian, configuration, T, backend, rng)
 
     E_array = np.zeros(nsweep)
     M_array = np.zeros(nsweep)
     EE_array = np.zeros(nsweep)
     MM_array = np.zeros(nsweep)
-    E_array[0], M_array[0] = hamiltonian.compute_energy_and_mag(configuration, T)
+    E, M = hamiltonian.compute_energy_and_mag(configuration, T)
+    E_array[0], M_array[0] = E, M
+    if trajectory is not None:
+        trajectory.append(configuration, E, M)
     EE_array[0] = E_array[0]*E_array[0]
     MM_array[0] = M_array[0]*M_array[0]
     for i in range(1, nsweep):
-        configuration = metropolis_step(hamiltonian, configuration, T)
-        E, M = hamiltonian.compute_energy_and_mag(configuration, T)
+        # carry E and M along from the accepted flips
+        dE, dM = _sweep(hamiltonian, configuration, T, backend, rng)
+        E += dE
+        M += dM
+        if recompute_every and i % recompute_every == 0:
+            E, M = hamiltonian.compute_energy_and_mag(configuration, T)
+        if trajectory is not None:
+            trajectory.append(configuration, E, M)
 
-        # E_array[i] = E
-        E_array[i]  = (E_array[i-1]*(i) + E)/(i+1)
-        EE_array[i] = (EE_array[i-1]*(i) + E*E)/(i+1)
+        # running means, updated without rescaling the previous sum
+        E_array[i]  = E_array[i-1] + (E - E_array[i-1])/(i+1)
+        EE_array[i] = EE_array[i-1] + (E*E - EE_array[i-1])/(i+1)
 
-        #M_array[i]  = M
-        M_array[i]  = (M_array[i-1]*(i) + M)/(i+1)
-        MM_array[i] = (MM_array[i-1]*(i) + M*M)/(i+1)
+        M_array[i]  = M_array[i-1] + (M - M_array[i-1])/(i+1)
+        MM_array[i] = MM_array[i-1] + (M*M - MM_array[i-1])/(i+1)
     return E_array, M_array, EE_array, MM_array
 
 
+def cluster_montecarlo(hamiltonian: ham,
+                       configuration: bs,
+                       T: int, nsweep: int,
+                       nburn: int,
+                       method: str = "wolff",
+                       rng: np.random.Generator = None,
+                       recompute_every: int = 0,
+                       trajectory: TrajectoryWriter = None) -> tuple:
+    """
+    Sample the energy and magnetization with cluster updates, which do not
+    slow down near the critical temperature of ferromagnets
+
+    Takes and returns the same values as `metropolis_montecarlo`, so the
+    two can be swapped.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    configuration : BitString
+        The initial configuration of the system
+    T : int
+        The temperature of the system
+    nsweep : int
+        The number of updates to perform, a single cluster for Wolff and
+        all the clusters for Swendsen-Wang
+    nburn : int
+        The number of updates to burn
+    method : str
+        "wolff" for `Cluster.wolff_step` or "swendsen_wang" for
+        `Cluster.swendsen_wang_step`
+    rng : np.random.Generator
+        Source of the random numbers, the global np.random state if None
+    recompute_every : int
+        If non-zero, E and M are recomputed from scratch every
+        `recompute_every` sweeps
+    trajectory : TrajectoryWriter
+        If given, every measured configuration is appended to it with its
+        energy and magnetization
+
+    Returns
+    -------
+    tuple
+        The energy, magnetization, energy squared, and magnetization squared
+
+    Raises
+    ------
+    ValueError :
+        if the method is not a cluster update
+    """
+    if method not in ("wolff", "swendsen_wang"):
+        raise ValueError(f"Unknown cluster update {method}, use \"wolff\" or \"swendsen_wang\"")
+    return metropolis_montecarlo(hamiltonian, configuration, T, nsweep, nburn, backend=method,
+                                 rng=rng, recompute_every=recompute_every, trajectory=trajectory)
+
+
+def metropolis_iterate(hamiltonian: ham,
+                       configuration: bs,
+                       T: int, nsweep: int,
+                       nburn: int,
+                       every: int = 1000,
+                       thin: int = 1,
+                       backend: str = None,
+                       rng: np.random.Generator = None,
+                       recompute_every: int = 0,
+                       trajectory: TrajectoryWriter = None,
+                       target_stderr=None):
+    """
+    Run the Metropolis Monte Carlo algorithm in constant memory, reporting
+    the running averages as the sampling goes
+
+    The samples are the same as in `metropolis_montecarlo`, but only
+    running moments are kept instead of nsweep-long arrays.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    configuration : BitString
+        The initial configuration of the system
+    T : int
+        The temperature of the system
+    nsweep : int
+        The number of sweeps to perform
+    nburn : int
+        The number of sweeps to burn
+    every : int
+        The number of sweeps between two reports
+    thin : int
+        Only every `thin`-th sweep is measured
+    backend : str
+        Sweep to use, see `metropolis_montecarlo`
+    rng : np.random.Generator
+        Source of the random numbers, the global np.random state if None
+    recompute_every : int
+        E and M are updated from the energy change of each accepted flip.
+        If non-zero, they are recomputed from scratch every
+        `recompute_every` sweeps to remove any accumulated round-off.
+    trajectory : TrajectoryWriter
+        If given, every measured configuration is appended to it with its
+        energy and magnetization
+    target_stderr : float or tuple
+        If given, nsweep is only an upper bound: sampling stops at the first
+        report where the blocking standard errors of the energy and of the
+        magnetization are below the target, one value for both or an (E, M)
+        pair with None for an observable that is not checked
+
+    Yields
+    ------
+    tuple
+        The number of sweeps done, and the running energy, magnetization,
+        energy squared and magnetization squared averages. The last report
+        is always made after the final sweep.
+    """
+    yield from _iterate(hamiltonian, configuration, T, nsweep, nburn, every, thin, backend, rng,
+                        recompute_every, trajectory, target_stderr, BlockingMoments(), BlockingMoments())
+
+
+def _converged(stats: tuple, target_stderr) -> bool:
+    """
+    Whether the standard errors of the E and M samples are below the target
+    """
+    if np.ndim(target_stderr) == 0:
+        target_stderr = (target_stderr, target_stderr)
+    for moments, target in zip(stats, target_stderr):
+        # a nan error (too few samples) never passes
+        if target is not None and not moments.stderr() <= target:
+            return False
+    return True
+
+
+def _iterate(hamiltonian: ham, configuration: bs, T: int, nsweep: int, nburn: int, every: int,
+             thin: int, backend: str, rng: np.random.Generator, recompute_every: int,
+             trajectory: TrajectoryWriter, target_stderr, E_stats: BlockingMoments,
+             M_stats: BlockingMoments):
+    """
+    The loop of `metropolis_iterate`, accumulating the samples into the
+    given moments so the caller can read their error analysis
+    """
+    for j in range(nburn):
+        _sweep(hamiltonian, configuration, T, backend, rng)
+
+    E, M = hamiltonian.compute_energy_and_mag(configuration, T)
+    for i in range(nsweep):
+        if i > 0:
+            dE, dM = _sweep(hamiltonian, configuration, T, backend, rng)
+            E += dE
+            M += dM
+            if recompute_every and i % recompute_every == 0:
+                E, M = hamiltonian.compute_energy_and_mag(configuration, T)
+        if i % thin == 0:
+            E_stats.add(E)
+            M_stats.add(M)
+            if trajectory is not None:
+                trajectory.append(configuration, E, M)
+        if (i + 1) % every == 0 or i == nsweep - 1:
+            yield (i + 1, E_stats.mean, M_stats.mean, E_stats.mean_square(), M_stats.mean_square())
+            if target_stderr is not None and _converged((E_stats, M_stats), target_stderr):
+                return
+
+
+def metropolis_montecarlo_stream(hamiltonian: ham,
+                                 configuration: bs,
+                                 T: int, nsweep: int,
+                                 nburn: int,
+                                 every: int = 1000,
+                                 thin: int = 1,
+                                 callback=None,
+                                 backend: str = None,
+                                 rng: np.random.Generator = None,
+                                 recompute_every: int = 0,
+                                 trajectory: TrajectoryWriter = None,
+                                 target_stderr=None,
+                                 errors: bool = False) -> tuple:
+    """
+    Constant memory version of `metropolis_montecarlo` that only returns
+    the final averages
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    configuration : BitString
+        The initial configuration of the system
+    T : int
+        The temperature of the system
+    nsweep : int
+        The number of sweeps to perform
+    nburn : int
+        The number of sweeps to burn
+    every : int
+        The number of sweeps between two calls of the callback
+    thin : int
+        Only every `thin`-th sweep is measured
+    callback : callable
+        Called as callback(sweeps_done, E, M, EE, MM) with the running
+        averages, to follow the convergence live
+    backend : str
+        Sweep to use, see `metropolis_montecarlo`
+    rng : np.random.Generator
+        Source of the random numbers, the global np.random state if None
+    recompute_every : int
+        E and M are updated from the energy change of each accepted flip.
+        If non-zero, they are recomputed from scratch every
+        `recompute_every` sweeps to remove any accumulated round-off.
+    trajectory : TrajectoryWriter
+        If given, every measured configuration is appended to it with its
+        energy and magnetization
+    target_stderr : float or tuple
+        Stop early once the standard errors of E and M reach this target,
+        see `metropolis_iterate`
+    errors : bool
+        Whether to also return the error analysis of the samples
+
+    Returns
+    -------
+    tuple
+        The energy, magnetization, energy squared, and magnetization squared
+        averages. With errors=True, followed by the blocking standard errors
+        of the E and M averages and their effective sample sizes, as two
+        arrays of (E, M) values.
+    """
+    E_stats = BlockingMoments()
+    M_stats = BlockingMoments()
+    report = (0, np.nan, np.nan, np.nan, np.nan)
+    for report in _iterate(hamiltonian, configuration, T, nsweep, nburn, every, thin, backend, rng,
+                           recompute_every, trajectory, target_stderr, E_stats, M_stats):
+        if callback is not None:
+            callback(*report)
+    if errors:
+        stderr = np.array([E_stats.stderr(), M_stats.stderr()])
+        ess = np.array([E_stats.effective_sample_size(), M_stats.effective_sample_size()])
+        return report[1:] + (stderr, ess)
+    return report[1:]
+
+
+def _sweep(hamiltonian: ham, configuration: bs, T: int, backend: str,
+           rng: np.random.Generator = None) -> tuple:
+    """
+    One sweep with `metropolis_step`, or with the given kernel backend,
+    updating the configuration in place
+
+    Returns the change of the energy and of the magnetization.
+    """
+    if backend is None:
+        return _metropolis_step(hamiltonian, configuration, T, rng)
+    if backend == "checkerboard":
+        return _checkerboard_step(hamiltonian, configuration, T, rng)
+    if backend == "wolff":
+        return _wolff_step(hamiltonian, configuration, T, rng)
+    if backend == "swendsen_wang":
+        return _swendsen_wang_step(hamiltonian, configuration, T, rng)
+    dE, dM = metropolis_sweep(hamiltonian, configuration, T, rng=rng, backend=backend)
+    return dE[0], dM[0]
+
+
+def _run_chain(hamiltonian: ham, config: np.array, T: int, nsweep: int, nburn: int,
+               backend: str, seed: np.random.SeedSequence) -> np.array:
+    """
+    Run one chain of `metropolis_montecarlo_chains` and return its final
+    E, M, E^2 and M^2 averages
+    """
+    configuration = bs(len(config))
+    configuration.set_config(config)
+    averages = metropolis_montecarlo(hamiltonian, configuration, T, nsweep, nburn,
+                                     backend=backend, rng=np.random.default_rng(seed))
+    return np.array([values[-1] for values in averages])
+
+
+def metropolis_montecarlo_chains(hamiltonian: ham,
+                                 configuration: bs,
+                                 T: int, nsweep: int,
+                                 nburn: int,
+                                 n_chains: int,
+                                 seed: int = None,
+                                 n_workers: int = None,
+                                 backend: str = None) -> tuple:
+    """
+    Run independent Metropolis Monte Carlo chains in parallel to get
+    averages with error bars
+
+    Every chain starts from the same configuration and draws from its own
+    np.random.Generator, spawned from a single SeedSequence, so the results
+    only depend on the seed and not on the number of workers.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    configuration : BitString
+        The initial configuration of every chain, it is not modified
+    T : int
+        The temperature of the system
+    nsweep : int
+        The number of sweeps to perform per chain
+    nburn : int
+        The number of sweeps to burn per chain
+    n_chains : int
+        The number of chains
+    seed : int
+        Seed of the SeedSequence the chain streams are spawned from
+    n_workers : int
+        Number of worker processes, os.cpu_count() if None. With 0 or 1 the
+        chains run in this process.
+    backend : str
+        Sweep used by the chains, see `metropolis_montecarlo`
+
+    Returns
+    -------
+    tuple
+        The (n_chains, 4) array of the energy, magnetization, energy squared
+        and magnetization squared averages of each chain, their mean over the
+        chains and the standard error of that mean
+    """
+    seeds = np.random.SeedSequence(seed).spawn(n_chains)
+    tasks = [(hamiltonian, configuration.config.copy(), T, nsweep, nburn, backend, chain_seed)
+             for chain_seed in seeds]
+    if n_workers is not None and n_workers <= 1:
+        chains = [_run_chain(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            chains = list(pool.map(_run_chain, *zip(*tasks)))
+    chains = np.array(chains)
+    mean = chains.mean(axis=0)
+    if n_chains > 1:
+        stderr = chains.std(axis=0, ddof=1) / np.sqrt(n_chains)
+    else:
+        stderr = np.full(4, np.nan)
+    return chains, mean, stderr
+
+
 def metropolis_step(hamiltonian: ham,
                     configuration: bs,
-                    T: int,) -> bs:
+                    T: int,
+                    rng: np.random.Generator = None) -> bs:
     """
     Taking a single step forward in the Metropolis Monte Carlo algorithm
 
@@ -68,6 +433,8 @@ def metropolis_step(hamiltonian: ham,
         The initial configuration of the system
     T : int
         The temperature of the system
+    rng : np.random.Generator
+        Source of the uniform numbers, the global np.random state if None
 
     Returns
     -------
@@ -91,27 +458,126 @@ def metropolis_step(hamiltonian: ham,
 
     # return configuration
 
+    _metropolis_step(hamiltonian, configuration, T, rng)
+    return configuration
+
+
+def _metropolis_step(hamiltonian: ham, configuration: bs, T: int,
+                     rng: np.random.Generator = None) -> tuple:
+    """
+    One sweep of `metropolis_step`, returning the change of the energy
+    and of the magnetization
+    """
+    # one uniform number per site, drawn up front for the whole sweep
+    if rng is None:
+        rand = np.random.random(configuration.n)
+    else:
+        rand = rng.random(configuration.n)
+    table, quantum = hamiltonian.acceptance_table(T)
+
+    dE = 0.0
+    dM = 0
     for site_i in range(configuration.n):
-        delta_e = 0.0
         del_si = 2
         if configuration.config[site_i] == 1:
             del_si = -2
 
-        for j in hamiltonian.J[site_i]:
-            delta_e += (2.0*configuration.config[j[0]]-1.0) * j[1] * del_si
-
-        delta_e += hamiltonian.mu[site_i] * del_si
+        delta_e = hamiltonian.local_field(configuration.config, site_i) * del_si
 
         accept = True
         if delta_e > 0.0:
-            rand_comp = np.random.random()
-            if rand_comp > np.exp(-delta_e/T):
+            if quantum > 0:
+                accept_prob = table[int(round(delta_e / (2.0*quantum)))]
+            else:
+                accept_prob = np.exp(-delta_e/T)
+            if rand[site_i] > accept_prob:
                 accept = False
         if accept:
             if configuration.config[site_i] == 0:
                 configuration.config[site_i] = 1
             else:
                 configuration.config[site_i] = 0
+            dE += delta_e
+            dM += del_si
+    return dE, dM
+
+
+def checkerboard_step(hamiltonian: ham,
+                      configuration: bs,
+                      T: int,
+                      rng: np.random.Generator = None) -> bs:
+    """
+    Taking a single sweep of the Metropolis Monte Carlo algorithm,
+    one color class of the coupling graph at a time
+
+    The sites of a color class are not coupled to each other, so their
+    single-spin Metropolis updates are independent and are all done in one
+    vectorized step. On bipartite lattices this is the checkerboard update.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    configuration : BitString
+        The initial configuration of the system
+    T : int
+        The temperature of the system
+    rng : np.random.Generator
+        Source of the uniform numbers, the global np.random state if None
+
+    Returns
+    -------
+    BitString
+        The new configuration of the system
+    """
+    _checkerboard_step(hamiltonian, configuration, T, rng)
     return configuration
 
 
+def _checkerboard_step(hamiltonian: ham, configuration: bs, T: int,
+                       rng: np.random.Generator = None) -> tuple:
+    """
+    One sweep of `checkerboard_step`, returning the change of the energy
+    and of the magnetization
+    """
+    dE = 0.0
+    dM = 0
+    for sites in hamiltonian.coloring():
+        del_si = 2 - 4*configuration.config[sites]
+        delta_e = hamiltonian.local_fields(configuration.config, sites) * del_si
+        if rng is None:
+            rand_comp = np.random.random(len(sites))
+        else:
+            rand_comp = rng.random(len(sites))
+        accept = rand_comp <= hamiltonian.acceptance_probability(delta_e, T)
+        configuration.config[sites[accept]] = 1 - configuration.config[sites[accept]]
+        dE += delta_e[accept].sum()
+        dM += del_si[accept].sum()
+    return dE, dM
+
+
+def _checkerboard_batch(hamiltonian: ham, configs: np.array, T: float,
+                        rng: np.random.Generator = None) -> tuple:
+    """
+    One sweep of `checkerboard_step` applied to every row of a (K, N)
+    array of configurations at once, in place
+
+    Returns the change of the energy of each configuration and the fraction
+    of accepted flips.
+    """
+    dE = np.zeros(len(configs))
+    accepted = 0
+    for sites in hamiltonian.coloring():
+        del_si = 2 - 4*configs[:, sites]
+        delta_e = hamiltonian.local_fields(configs, sites) * del_si
+        if rng is None:
+            rand_comp = np.random.random(delta_e.shape)
+        else:
+            rand_comp = rng.random(delta_e.shape)
+        accept = rand_comp <= hamiltonian.acceptance_probability(delta_e, T)
+        block = configs[:, sites]
+        block[accept] = 1 - block[accept]
+        configs[:, sites] = block
+        dE += np.where(accept, delta_e, 0.0).sum(axis=1)
+        accepted += int(accept.sum())
+    return dE, accepted / configs.size
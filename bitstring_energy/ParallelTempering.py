@@ -0,0 +1,145 @@
+"""Parallel tempering (replica exchange) over a ladder of temperatures."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .BitString import BitString as bs
+from .Energy import IsingHamiltonian as ham
+from .Kernels import metropolis_sweep
+
+# Hamiltonian of the worker processes, set once by _init_worker so it is
+# not pickled again for every task
+_worker_hamiltonian = None
+
+
+def _init_worker(hamiltonian: ham) -> None:
+    """
+    Store the Hamiltonian in a worker process
+    """
+    global _worker_hamiltonian
+    _worker_hamiltonian = hamiltonian
+
+
+def _run_replica(config: np.array, T: float, n_sweeps: int,
+                 rng: np.random.Generator, backend: str, hamiltonian: ham = None) -> tuple:
+    """
+    Run the sweeps of one replica between two exchange attempts
+
+    Returns the new configuration, the generator in its new state, the final
+    energy and the sums of E, M, E^2 and M^2 over the sweeps.
+    """
+    if hamiltonian is None:
+        hamiltonian = _worker_hamiltonian
+    configuration = bs(len(config))
+    configuration.set_config(config)
+    E0, M0 = hamiltonian.compute_energy_and_mag(configuration, T)
+    dE, dM = metropolis_sweep(hamiltonian, configuration, T, n_sweeps=n_sweeps, rng=rng, backend=backend)
+    E = E0 + np.cumsum(dE)
+    M = M0 + np.cumsum(dM)
+    sums = np.array([E.sum(), M.sum(), (E*E).sum(), (M*M).sum()])
+    return configuration.config, rng, E[-1], sums
+
+
+def parallel_tempering(hamiltonian: ham,
+                       temps: np.array,
+                       nsweep: int,
+                       nburn: int,
+                       exchange_every: int = 10,
+                       n_workers: int = None,
+                       seed: int = None,
+                       backend: str = "auto") -> tuple:
+    """
+    Sample the Ising Hamiltonian at several temperatures at once with
+    replica exchange
+
+    One replica per temperature is swept in a process pool. Every
+    `exchange_every` sweeps, neighboring temperatures (alternately the even
+    and the odd pairs) try to swap their configurations with probability
+    min(1, exp((1/T_k - 1/T_k+1) (E_k - E_k+1))), which lets the cold
+    replicas escape from local minima through the hot ones.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian that we are sampling
+    temps : np.array
+        Temperature ladder, one replica per temperature
+    nsweep : int
+        The number of sweeps to average over
+    nburn : int
+        The number of sweeps to burn
+    exchange_every : int
+        The number of sweeps between two exchange attempts
+    n_workers : int
+        Number of worker processes, os.cpu_count() if None. With 0 or 1 the
+        replicas run in this process, with the same results.
+    seed : int
+        Seed of the random streams of the replicas and of the exchanges
+    backend : str
+        Sweep kernel used by the replicas, see `Kernels.metropolis_sweep`
+
+    Returns
+    -------
+    tuple
+        The energy, magnetization, energy squared and magnetization squared
+        averaged at each temperature, and the acceptance rate of the
+        exchanges between each pair of neighboring temperatures
+    """
+    temps = np.asarray(temps, dtype=float)
+    n_replicas = len(temps)
+    streams = np.random.SeedSequence(seed).spawn(n_replicas + 1)
+    rngs = [np.random.default_rng(stream) for stream in streams[:n_replicas]]
+    swap_rng = np.random.default_rng(streams[-1])
+    configs = [rng.integers(0, 2, size=hamiltonian.n) for rng in rngs]
+
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    pool = None
+    if n_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=min(n_workers, n_replicas),
+                                   initializer=_init_worker, initargs=(hamiltonian,))
+
+    sums = np.zeros((n_replicas, 4))
+    n_measured = 0
+    swaps_tried = np.zeros(n_replicas - 1)
+    swaps_accepted = np.zeros(n_replicas - 1)
+    energies = np.zeros(n_replicas)
+    try:
+        done = 0
+        exchange_round = 0
+        while done < nburn + nsweep:
+            # stop exactly at the end of the burn-in before measuring
+            if done < nburn:
+                n_sweeps = min(exchange_every, nburn - done)
+            else:
+                n_sweeps = min(exchange_every, nburn + nsweep - done)
+            tasks = [(configs[k], temps[k], n_sweeps, rngs[k], backend) for k in range(n_replicas)]
+            if pool is None:
+                results = [_run_replica(*task, hamiltonian=hamiltonian) for task in tasks]
+            else:
+                results = list(pool.map(_run_replica, *zip(*tasks)))
+            for k, (config, rng, energy, replica_sums) in enumerate(results):
+                configs[k] = config
+                rngs[k] = rng
+                energies[k] = energy
+                if done >= nburn:
+                    sums[k] += replica_sums
+            if done >= nburn:
+                n_measured += n_sweeps
+            done += n_sweeps
+
+            for k in range(exchange_round % 2, n_replicas - 1, 2):
+                swaps_tried[k] += 1
+                log_accept = (1/temps[k] - 1/temps[k+1]) * (energies[k] - energies[k+1])
+                if log_accept >= 0 or swap_rng.random() < np.exp(log_accept):
+                    swaps_accepted[k] += 1
+                    configs[k], configs[k+1] = configs[k+1], configs[k]
+                    energies[k], energies[k+1] = energies[k+1], energies[k]
+            exchange_round += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    averages = sums / max(n_measured, 1)
+    swap_rate = swaps_accepted / np.maximum(swaps_tried, 1)
+    return averages[:, 0], averages[:, 1], averages[:, 2], averages[:, 3], swap_rate
@@ -0,0 +1,330 @@
+"""Statistics of sampled observables."""
+
+import numpy as np
+
+
+class RunningMoments:
+    """
+    Constant memory running mean and variance of a stream of values
+
+    Uses Welford's update for single values and Chan's pairwise merge for
+    blocks, which avoid the cancellation of accumulating sum(x) and sum(x^2).
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float) -> None:
+        """
+        Add a single value
+
+        Parameters
+        ----------
+        x : float
+            New value
+        """
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def add_many(self, values: np.array) -> None:
+        """
+        Add a block of values at once
+
+        Parameters
+        ----------
+        values : np.array
+            New values
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        count = len(values)
+        mean = values.mean()
+        m2 = ((values - mean)**2).sum()
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+
+    def variance(self) -> float:
+        """
+        Returns
+        -------
+        variance : float
+            Population variance of the values, <x^2> - <x>^2
+        """
+        if self.count == 0:
+            return np.nan
+        return self.m2 / self.count
+
+    def mean_square(self) -> float:
+        """
+        Returns
+        -------
+        mean_square : float
+            Average of the squared values, <x^2>
+        """
+        return self.variance() + self.mean**2
+
+
+# Fewest blocks a blocking level needs for its error to be trusted
+MIN_BLOCKS = 32
+
+
+def samples_from_running_means(means: np.array) -> np.array:
+    """
+    Recover the sampled values from the running means returned by
+    `metropolis_montecarlo`
+
+    Parameters
+    ----------
+    means : np.array
+        Running means, means[i] is the average of the first i+1 values
+
+    Returns
+    -------
+    samples : np.array
+        The values, up to round-off
+    """
+    means = np.asarray(means, dtype=float)
+    totals = means * np.arange(1, len(means) + 1)
+    return np.diff(totals, prepend=0.0)
+
+
+def autocorrelation(x: np.array) -> np.array:
+    """
+    Normalized autocorrelation function of a series, computed with FFTs
+    in O(n log n)
+
+    Parameters
+    ----------
+    x : np.array
+        The series
+
+    Returns
+    -------
+    rho : np.array
+        rho[t] is the correlation between values t steps apart, rho[0] = 1
+    """
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    # zero padding to twice the length turns the circular correlation into a linear one
+    size = 1 << (2*n - 1).bit_length()
+    f = np.fft.rfft(x - x.mean(), n=size)
+    acf = np.fft.irfft(f * np.conjugate(f), n=size)[:n]
+    if acf[0] == 0:
+        rho = np.zeros(n)
+        rho[0] = 1.0
+        return rho
+    return acf / acf[0]
+
+
+def integrated_time(x: np.array, c: float = 5.0) -> float:
+    """
+    Integrated autocorrelation time tau = 1 + 2 sum_t rho(t), with Sokal's
+    automatic window
+
+    The sum is cut at the smallest window W with W >= c*tau(W), which keeps
+    the noise of the large-t terms out of the estimate.
+
+    Parameters
+    ----------
+    x : np.array
+        The series
+    c : float
+        Window constant, about 5 for exponentially decaying correlations
+
+    Returns
+    -------
+    tau : float
+        Number of steps between two effectively independent values, at least 1
+    """
+    rho = autocorrelation(x)
+    taus = 2.0*np.cumsum(rho) - 1.0
+    window = np.flatnonzero(np.arange(len(taus)) >= c*taus)
+    tau = taus[window[0]] if len(window) > 0 else taus[-1]
+    return max(float(tau), 1.0)
+
+
+def effective_sample_size(x: np.array, c: float = 5.0) -> float:
+    """
+    Number of independent values the series is worth, n / tau
+
+    Parameters
+    ----------
+    x : np.array
+        The series
+    c : float
+        Window constant of `integrated_time`
+
+    Returns
+    -------
+    ess : float
+        Effective sample size
+    """
+    return len(x) / integrated_time(x, c)
+
+
+def blocking_errors(x: np.array) -> tuple:
+    """
+    Standard error of the mean from blocks of 1, 2, 4, ... values, as in
+    Flyvbjerg and Petersen's blocking analysis
+
+    Parameters
+    ----------
+    x : np.array
+        The series
+
+    Returns
+    -------
+    (errors, counts) : tuple
+        Standard error and number of blocks of each level
+    """
+    blocks = np.asarray(x, dtype=float)
+    errors, counts = [], []
+    while len(blocks) >= 2:
+        errors.append(np.sqrt(blocks.var(ddof=1) / len(blocks)))
+        counts.append(len(blocks))
+        blocks = 0.5*(blocks[0:len(blocks) - 1:2] + blocks[1::2])
+    return np.array(errors), np.array(counts)
+
+
+def _plateau(errors: np.array, counts: np.array) -> float:
+    """
+    Error at the first blocking level where it stops growing
+
+    A level is on the plateau when the next one is within the statistical
+    uncertainty err/sqrt(2(n-1)) of its error. Only levels with MIN_BLOCKS
+    blocks are used; without a plateau the largest of their errors is
+    returned, and nan when there are too few values.
+    """
+    usable = np.flatnonzero(counts >= MIN_BLOCKS)
+    if len(usable) == 0:
+        return np.nan
+    for level in usable[:-1]:
+        if errors[level + 1] - errors[level] <= errors[level] / np.sqrt(2.0*(counts[level] - 1)):
+            return float(errors[level])
+    return float(errors[usable].max())
+
+
+def error_analysis(x: np.array, c: float = 5.0) -> tuple:
+    """
+    Mean of a correlated series with its error bar
+
+    Parameters
+    ----------
+    x : np.array
+        The series, e.g. the energies of a trajectory or the output of
+        `samples_from_running_means`
+    c : float
+        Window constant of `integrated_time`
+
+    Returns
+    -------
+    (mean, stderr, tau, ess) : tuple
+        The mean, its standard error sqrt(var*tau/n), the integrated
+        autocorrelation time and the effective sample size
+    """
+    x = np.asarray(x, dtype=float)
+    tau = integrated_time(x, c)
+    return x.mean(), np.sqrt(x.var() * tau / len(x)), tau, len(x) / tau
+
+
+class BlockingMoments(RunningMoments):
+    """
+    Running moments that also run a blocking analysis, in O(log n) memory
+
+    Each value is added to level 0, and every two values of a level are
+    averaged into one value of the next level, so level k holds the means of
+    blocks of 2**k consecutive values, as `blocking_errors` does for a
+    stored series.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.levels = []
+        self._pending = []
+
+    def add(self, x: float) -> None:
+        """
+        Add a single value
+
+        Parameters
+        ----------
+        x : float
+            New value
+        """
+        super().add(x)
+        level = 0
+        while True:
+            if level == len(self.levels):
+                self.levels.append(RunningMoments())
+                self._pending.append(None)
+            self.levels[level].add(x)
+            if self._pending[level] is None:
+                self._pending[level] = x
+                return
+            x = 0.5*(self._pending[level] + x)
+            self._pending[level] = None
+            level += 1
+
+    def add_many(self, values: np.array) -> None:
+        """
+        Add a block of values, one at a time so the blocks stay aligned
+
+        Parameters
+        ----------
+        values : np.array
+            New values
+        """
+        for x in np.asarray(values, dtype=float).tolist():
+            self.add(x)
+
+    def errors(self) -> tuple:
+        """
+        Returns
+        -------
+        (errors, counts) : tuple
+            Standard error and number of blocks of each level with at least
+            two blocks
+        """
+        levels = [level for level in self.levels if level.count >= 2]
+        counts = np.array([level.count for level in levels])
+        errors = np.array([np.sqrt(level.m2 / (level.count - 1) / level.count) for level in levels])
+        return errors, counts
+
+    def stderr(self) -> float:
+        """
+        Returns
+        -------
+        stderr : float
+            Standard error of the mean at the blocking plateau, nan while
+            there are fewer than MIN_BLOCKS values
+        """
+        return _plateau(*self.errors())
+
+    def tau(self) -> float:
+        """
+        Returns
+        -------
+        tau : float
+            Integrated autocorrelation time implied by the blocking error
+        """
+        naive = np.sqrt(self.m2 / (self.count - 1) / self.count) if self.count >= 2 else np.nan
+        if naive == 0:
+            return 1.0
+        return max((self.stderr() / naive)**2, 1.0)
+
+    def effective_sample_size(self) -> float:
+        """
+        Returns
+        -------
+        ess : float
+            Number of independent values the samples are worth
+        """
+        return self.count / self.tau()
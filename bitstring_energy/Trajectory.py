@@ -0,0 +1,260 @@
+"""Binary trajectory files of sampled configurations with their energy and magnetization."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .BitString import BitString as bs
+from .BitStringArray import BitStringArray
+
+# File layout: a 32 byte header (magic, format version, number of spins,
+# bytes per packed configuration) followed by fixed size records
+MAGIC = b"BSETRAJ\0"
+VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("reserved", "<u4"),
+                         ("n", "<u8"), ("n_bytes", "<u8")])
+
+
+def record_dtype(n: int) -> np.dtype:
+    """
+    Record of one sample: energy, magnetization and the configuration
+    packed 8 spins per byte
+
+    Parameters
+    ----------
+    n : int
+        Number of spins
+
+    Returns
+    -------
+    dtype : np.dtype
+        Structured dtype of a record
+    """
+    return np.dtype([("E", "<f8"), ("M", "<f8"), ("config", "u1", ((n + 7) // 8,))])
+
+
+def _read_header(f) -> int:
+    """
+    Check the header of an open trajectory file and return the number of spins
+    """
+    header = np.frombuffer(f.read(HEADER_DTYPE.itemsize), dtype=HEADER_DTYPE, count=1)[0]
+    if header["magic"] != MAGIC.rstrip(b"\0") or header["version"] != VERSION:
+        raise ValueError("Not a bitstring_energy trajectory file")
+    return int(header["n"])
+
+
+class TrajectoryWriter:
+    """
+    Append samples to a trajectory file
+
+    Samples are collected in a buffer of records, and full buffers are
+    written by a background thread so the sampler does not wait on the disk.
+    """
+
+    def __init__(self, path: str, n: int, buffer_size: int = 4096, append: bool = False) -> None:
+        """
+        Parameters
+        ----------
+        path : str
+            File to write
+        n : int
+            Number of spins
+        buffer_size : int
+            Number of samples kept in memory before being written
+        append : bool
+            Add to an existing trajectory instead of starting a new one
+
+        Raises
+        ------
+        ValueError :
+            if the existing file is not a trajectory of n spins
+        """
+        self.path = path
+        self.n = n
+        self.dtype = record_dtype(n)
+        if append and os.path.exists(path):
+            with open(path, "rb") as f:
+                if _read_header(f) != n:
+                    raise ValueError(f"{path} does not hold configurations of {n} spins")
+            # drop a record cut short by an interrupted run, so the new ones stay aligned
+            n_records = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // self.dtype.itemsize
+            os.truncate(path, HEADER_DTYPE.itemsize + n_records * self.dtype.itemsize)
+            self._file = open(path, "ab")
+        else:
+            self._file = open(path, "wb")
+            header = np.array([(MAGIC, VERSION, 0, n, self.dtype["config"].shape[0])], dtype=HEADER_DTYPE)
+            self._file.write(header.tobytes())
+        self._buffer = np.zeros(buffer_size, dtype=self.dtype)
+        self._count = 0
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def append(self, configuration: bs, E: float, M: float) -> None:
+        """
+        Add one sample
+
+        Parameters
+        ----------
+        configuration : BitString
+            Sampled configuration
+        E : float
+            Its energy
+        M : float
+            Its magnetization
+        """
+        record = self._buffer[self._count]
+        record["E"] = E
+        record["M"] = M
+        record["config"] = np.packbits(np.asarray(configuration.config, dtype=np.uint8))
+        self._count += 1
+        if self._count == len(self._buffer):
+            self.flush(wait=False)
+
+    def append_many(self, configs: np.array, E: np.array, M: np.array) -> None:
+        """
+        Add a block of samples
+
+        Parameters
+        ----------
+        configs : np.array
+            (K, N) array of 0s and 1s, or a BitStringArray
+        E : np.array
+            Their energies
+        M : np.array
+            Their magnetizations
+        """
+        self.flush(wait=False)
+        records = np.zeros(len(E), dtype=self.dtype)
+        records["E"] = E
+        records["M"] = M
+        records["config"] = np.packbits(np.asarray(configs, dtype=np.uint8), axis=1)
+        self._submit(records)
+
+    def _submit(self, records: np.array) -> None:
+        """
+        Write records in the background thread, after the previous ones
+
+        The bytes are copied here, so the buffer can be refilled right away.
+        """
+        self._pending = self._writer.submit(self._file.write, records.tobytes())
+
+    def flush(self, wait: bool = True) -> None:
+        """
+        Write the buffered samples
+
+        Parameters
+        ----------
+        wait : bool
+            Whether to wait until they are on disk
+        """
+        if self._count > 0:
+            self._submit(self._buffer[:self._count])
+            self._count = 0
+        if wait and self._pending is not None:
+            self._pending.result()
+            self._file.flush()
+
+    def close(self) -> None:
+        """
+        Write the remaining samples and close the file
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        self._writer.shutdown()
+        self._file.close()
+
+
+class TrajectoryReader:
+    """
+    Memory-mapped view of a trajectory file
+
+    Nothing is loaded until it is used, so slices of trajectories larger
+    than the memory can be analyzed.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Parameters
+        ----------
+        path : str
+            File to read
+
+        Raises
+        ------
+        ValueError :
+            if the file is not a trajectory
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self.n = _read_header(f)
+        self.dtype = record_dtype(self.n)
+        # a record cut short by an interrupted run is ignored
+        n_records = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // self.dtype.itemsize
+        if n_records > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r",
+                                     offset=HEADER_DTYPE.itemsize, shape=(n_records,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self) -> int:
+        """
+        Returns
+        -------
+        length : int
+            number of samples
+        """
+        return len(self.records)
+
+    @property
+    def energies(self) -> np.array:
+        """
+        Memory-mapped energies of the samples
+        """
+        return self.records["E"]
+
+    @property
+    def magnetizations(self) -> np.array:
+        """
+        Memory-mapped magnetizations of the samples
+        """
+        return self.records["M"]
+
+    def configs(self, index=slice(None)) -> BitStringArray:
+        """
+        Unpack the configurations of some samples
+
+        Parameters
+        ----------
+        index : slice or np.array
+            which samples to unpack, all of them by default
+
+        Returns
+        -------
+        BitStringArray
+            the configurations
+        """
+        return BitStringArray.from_packed(self.records["config"][index], self.n)
+
+    def __getitem__(self, index: int) -> bs:
+        """
+        Returns the configuration of one sample
+
+        Parameters
+        ----------
+        index : int
+            index of the sample
+
+        Returns
+        -------
+        BitString
+            the configuration
+        """
+        configuration = bs(self.n)
+        configuration.set_config(np.unpackbits(self.records["config"][index], count=self.n))
+        return configuration
@@ -0,0 +1,227 @@
+"""Exact thermal averages of chains and narrow strips with transfer matrices."""
+
+import numpy as np
+from .Energy import IsingHamiltonian as ham
+
+# Widest block handled, its transfer matrices are 2**(width+1) on a side
+MAX_TRANSFER_WIDTH = 10
+
+# Number of matrix entries multiplied together in one batched product
+_BATCH_ENTRIES = 2**22
+
+
+def bandwidth(hamiltonian: ham) -> int:
+    """
+    Cyclic bandwidth of the couplings, the largest min(|i-j|, N-|i-j|) over
+    the coupled sites i and j
+
+    Periodic chains have bandwidth 1, and periodic L x W strips numbered
+    row by row, as `hypercubic_lattice((L, W))`, have bandwidth W.
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian
+
+    Returns
+    -------
+    width : int
+        The bandwidth, 0 when there are no couplings
+    """
+    src, dst, w = hamiltonian.edges()
+    distance = np.abs(dst - src)
+    return int(np.max(np.minimum(distance, hamiltonian.n - distance), initial=0))
+
+
+def transfer_matrix_cost(hamiltonian: ham) -> float:
+    """
+    Number of operations of `TransferMatrix`, inf when it does not apply
+
+    Parameters
+    ----------
+    hamiltonian : IsingHamiltonian
+        The Ising Hamiltonian
+
+    Returns
+    -------
+    cost : float
+        Roughly (N/w) * 2**(3(w+1)) for bandwidth w, to compare with the
+        2**N of the enumeration
+    """
+    width = max(bandwidth(hamiltonian), 1)
+    n_blocks = hamiltonian.n // width
+    if (n_blocks < 2 or width > MAX_TRANSFER_WIDTH):
+        return np.inf
+    return n_blocks * 2.0**(3*(width + 1))
+
+
+def _jet_product(A: tuple, B: tuple) -> tuple:
+    """
+    Product of two matrix jets A0 + A1 e + A2 e^2 + A3 d + A4 d^2, dropping
+    the terms of order 3 and the cross terms e*d
+    """
+    return (A[0] @ B[0],
+            A[0] @ B[1] + A[1] @ B[0],
+            A[0] @ B[2] + A[1] @ B[1] + A[2] @ B[0],
+            A[0] @ B[3] + A[3] @ B[0],
+            A[0] @ B[4] + A[3] @ B[3] + A[4] @ B[0])
+
+
+def _rescale(jet: tuple, log_scale: np.array) -> tuple:
+    """
+    Divide the matrices of a (batch of) jets by their largest entry of order
+    0, adding its log to log_scale, so long products do not overflow
+    """
+    top = np.max(np.abs(jet[0]), axis=(-2, -1))
+    top = np.where(top > 0, top, 1.0)
+    return tuple(part / top[..., None, None] for part in jet), log_scale + np.log(top)
+
+
+class TransferMatrix:
+    """
+    Transfer matrix solver for couplings of small cyclic bandwidth
+
+    The sites are cut into N // w consecutive blocks of w or w+1 sites, for
+    bandwidth w, so that every coupling joins two sites of the same block
+    or of neighboring blocks (the last block neighboring the first).
+    The partition function is then the trace of a product of one
+    2**size x 2**size matrix per block, in O(N/w * 8**w) instead of O(2**N).
+    The energy and magnetization moments come from the same product, each
+    matrix carrying its first and second order terms in exp(e*E + d*M).
+    """
+
+    def __init__(self, hamiltonian: ham, width: int = None) -> None:
+        """
+        Parameters
+        ----------
+        hamiltonian : IsingHamiltonian
+            The Ising Hamiltonian to solve
+        width : int
+            Smallest block size, the bandwidth of the couplings by default
+
+        Raises
+        ------
+        ValueError :
+            if there are fewer than two blocks or a coupling skips a block
+        """
+        n = hamiltonian.n
+        width = max(bandwidth(hamiltonian) if width is None else width, 1)
+        n_blocks = n // width
+        if (n_blocks < 2):
+            raise ValueError(f"{n} sites make fewer than two blocks of {width} sites")
+        sizes = np.array([len(block) for block in np.array_split(np.arange(n), n_blocks)])
+        first = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        block = np.repeat(np.arange(n_blocks), sizes)
+        local = np.arange(n) - first[block]
+        D = 2**int(sizes.max())
+        # spins of the local sites in every state of a block, -1 or +1
+        sigma = 2.0*((np.arange(D)[:, None] >> np.arange(sizes.max())[None, :]) & 1) - 1.0
+        valid = np.arange(D)[None, :] < 2**sizes[:, None]
+
+        # each coupling goes to the matrix of its first block:
+        # inside a block, or from block b to block b+1
+        src, dst, w = hamiltonian.edges()
+        b_src, b_dst = block[src], block[dst]
+        inside = b_src == b_dst
+        forward = ~inside & (b_dst == (b_src + 1) % n_blocks)
+        backward = ~inside & ~forward & (b_src == (b_dst + 1) % n_blocks)
+        if (not np.all(inside | forward | backward)):
+            raise ValueError(f"Some couplings are more than one block of {width} sites apart")
+        owner = np.where(backward, b_dst, b_src)
+        left = np.where(backward, local[dst], local[src])
+        right = np.where(backward, local[src], local[dst])
+
+        # energy[b, x, y] of block b in state x with the next block in state y,
+        # accumulated over chunks of couplings to bound the memory
+        energy = np.zeros((n_blocks, D, D))
+        np.add.at(energy, (block, slice(None), slice(None)),
+                  (hamiltonian.mu[:, None] * sigma[:, local].T)[:, :, None])
+        step = max(1, _BATCH_ENTRIES // (D*D))
+        for start in range(0, len(w), step):
+            part = slice(start, start + step)
+            # couplings inside a block only depend on its own state x
+            terms = np.where(inside[part, None], sigma[:, right[part]].T, 1.0)[:, :, None] * \
+                np.where(inside[part, None], 1.0, sigma[:, right[part]].T)[:, None, :]
+            terms = terms * (w[part, None] * sigma[:, left[part]].T)[:, :, None]
+            np.add.at(energy, owner[part], terms)
+        self.energy = energy
+        self.magnetization = np.cumsum(sigma, axis=1)[:, sizes - 1].T
+        # states beyond 2**size of a smaller block get no weight
+        self.valid = valid[:, :, None] & np.roll(valid, -1, axis=0)[:, None, :]
+        self.n = n
+        self.width = width
+
+    def __len__(self) -> int:
+        """
+        Returns
+        -------
+        length : int
+            number of blocks
+        """
+        return len(self.energy)
+
+    def _product(self, temp: float) -> tuple:
+        """
+        Jet of the product of the transfer matrices of all the blocks
+        """
+        n_blocks, D = self.energy.shape[:2]
+        group = max(1, _BATCH_ENTRIES // (D*D))
+        product = None
+        log_scale = 0.0
+        for start in range(0, n_blocks, group):
+            energy = self.energy[start:start + group]
+            valid = self.valid[start:start + group]
+            magnetization = self.magnetization[start:start + group, :, None]
+            lowest = np.min(np.where(valid, energy, np.inf), axis=(1, 2))
+            weight = np.where(valid, np.exp(-(energy - lowest[:, None, None]) / temp), 0.0)
+            energy = np.where(valid, energy, 0.0)
+            jet = (weight, weight*energy, 0.5*weight*energy**2,
+                   weight*magnetization, 0.5*weight*magnetization**2)
+            scales = np.zeros(len(weight))
+            # multiply neighbors pairwise, keeping the order of the blocks
+            while len(jet[0]) > 1:
+                pairs = len(jet[0]) // 2
+                merged = _jet_product(tuple(part[0:2*pairs:2] for part in jet),
+                                      tuple(part[1:2*pairs:2] for part in jet))
+                merged, merged_scales = _rescale(merged, scales[0:2*pairs:2] + scales[1:2*pairs:2])
+                if len(jet[0]) % 2 == 1:
+                    merged = tuple(np.concatenate([a, b[-1:]]) for a, b in zip(merged, jet))
+                    merged_scales = np.concatenate([merged_scales, scales[-1:]])
+                jet, scales = merged, merged_scales
+            jet = tuple(part[0] for part in jet)
+            if product is None:
+                product = jet
+            else:
+                product = _jet_product(product, jet)
+            product, log_scale = _rescale(product, log_scale + scales[0])
+        return product
+
+    def average_values(self, temps: np.array) -> tuple:
+        """
+        Compute the average values of the
+        Energy, Magnetization, Heat Capacity, and Magnetic Susceptibility
+
+        Parameters
+        ----------
+        temps : float or np.array
+            Temperatures of the system
+
+        Returns
+        -------
+        (E, M, HC, MS) : tuple
+            Averages, arrays with one value per temperature if temps is an
+            array
+        """
+        scalar = np.ndim(temps) == 0
+        temps = np.atleast_1d(np.asarray(temps, dtype=float))
+        results = np.zeros((4, len(temps)))
+        for i, temp in enumerate(temps):
+            traces = [np.trace(part) for part in self._product(temp)]
+            E = traces[1] / traces[0]
+            EE = 2.0*traces[2] / traces[0]
+            M = traces[3] / traces[0]
+            MM = 2.0*traces[4] / traces[0]
+            results[:, i] = (E, M, (EE - E**2) / temp**2, (MM - M**2) / temp)
+        if scalar:
+            return tuple(results[:, 0])
+        return tuple(results)
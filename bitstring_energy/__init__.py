@@ -2,7 +2,18 @@
 
 # Add imports here
 from .Energy import IsingHamiltonian
-from .BitString import BitString
-from .MonteCarlo import metropolis_montecarlo, metropolis_step
+from .BitString import BitString, PackedBitString, int_to_bits, bits_to_int
+from .BitStringArray import BitStringArray
+from .Lattices import hypercubic_lattice, hypercubic_edges
+from .MonteCarlo import metropolis_montecarlo, metropolis_step, checkerboard_step, metropolis_montecarlo_chains
+from .MonteCarlo import metropolis_iterate, metropolis_montecarlo_stream, cluster_montecarlo
+from .Cluster import wolff_step, swendsen_wang_step
+from .Statistics import error_analysis, integrated_time, effective_sample_size, blocking_errors
+from .Trajectory import TrajectoryWriter, TrajectoryReader
+from .ParallelTempering import parallel_tempering
+from .Annealing import simulated_annealing
+from .GroundState import ground_state
+from .Enumeration import exact_average_values, DensityOfStates, lowest_states, energy_spectrum
+from .TransferMatrix import TransferMatrix
 
 from ._version import __version__
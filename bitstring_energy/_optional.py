@@ -0,0 +1,35 @@
+"""Lazy imports of the optional dependencies."""
+
+import importlib
+
+
+def optional_import(name: str, extra: str):
+    """
+    Import an optional dependency when the feature using it is called
+
+    Keeping these imports out of module level means `import bitstring_energy`
+    only loads numpy, which matters for every worker process started by the
+    parallel samplers.
+
+    Parameters
+    ----------
+    name : str
+        module to import, e.g. "numba"
+    extra : str
+        the pyproject extra that installs it
+
+    Returns
+    -------
+    module
+        the imported module
+
+    Raises
+    ------
+    ImportError :
+        if the module is not installed
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError as err:
+        raise ImportError(f"{name} is required for this feature, "
+                          f"install it with `pip install bitstring_energy[{extra}]`") from err
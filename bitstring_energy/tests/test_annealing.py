@@ -0,0 +1,38 @@
+"""
+Tests for the simulated annealing search.
+"""
+
+import pytest
+import numpy as np
+import bitstring_energy as bse
+from bitstring_energy.Annealing import LinearSchedule
+
+
+def test_annealing_spin_glass():
+    # random +-1 couplings on a 3x4 torus, checked against all 2**12 states
+    N = 12
+    rng = np.random.default_rng(4)
+    src, dst = bse.hypercubic_edges((3, 4))
+    ham = bse.IsingHamiltonian.from_edges(src, dst, rng.choice([-1.0, 1.0], len(src)), rng.normal(0, .1, N))
+    E_all = ham.energies(bse.BitStringArray.from_ints(np.arange(2**N), N))[0]
+    for schedule in ("geometric", "linear", "adaptive"):
+        best, energy = bse.simulated_annealing(ham, n_sweeps=300, n_restarts=8, schedule=schedule, rng=rng)
+        assert np.isclose(energy, E_all.min()), f"{schedule}: found {energy} instead of {E_all.min()}"
+        assert np.isclose(ham.energy(best), energy)
+
+
+def test_annealing_early_stopping():
+    ham = bse.hypercubic_lattice((32, 32), J=-1)
+    rng = np.random.default_rng(1)
+    best, energy, history = bse.simulated_annealing(ham, n_sweeps=2000, n_restarts=4, schedule="adaptive",
+                                                    target_energy=-2048, rng=rng, return_history=True)
+    assert energy == -2048 and len(history) < 2000, "The search should stop at the ground state"
+    assert abs(best.on() - 512) == 512
+
+    schedule = LinearSchedule(4.0, 0.01)
+    best, energy, history = bse.simulated_annealing(ham, n_sweeps=2000, n_restarts=4, schedule=schedule,
+                                                    patience=20, rng=rng, return_history=True)
+    assert len(history) < 2000 and np.all(np.diff(history[:, 1]) <= 0)
+
+    with pytest.raises(ValueError):
+        bse.simulated_annealing(ham, schedule="exponential")
@@ -0,0 +1,37 @@
+"""
+Smoke test of the benchmark suite, so it keeps running as the code changes.
+"""
+
+import importlib.util
+import json
+import os
+import pytest
+
+SUITE = os.path.join(os.path.dirname(__file__), "..", "..", "benchmarks", "bench_suite.py")
+
+
+@pytest.mark.skipif(not os.path.exists(SUITE), reason="benchmarks are not shipped with the package")
+def test_bench_suite(tmp_path):
+    spec = importlib.util.spec_from_file_location("bench_suite", SUITE)
+    suite = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(suite)
+
+    output = str(tmp_path / "run.json")
+    # 16 and 17 sites round to the same 4x4 square, which runs once
+    args = ["--sizes", "16", "17", "--enum-sizes", "6", "--min-time", "0", "--output", output]
+    assert suite.main(args) == 0
+    with open(output) as f:
+        run = json.load(f)
+    groups = {entry["group"] for entry in run["results"]}
+    assert groups == {"bitstring", "energy", "enumeration", "metropolis"}
+    assert all(entry["value"] > 0 and entry["peak_mb"] >= 0 for entry in run["results"])
+    keys = [suite.key(entry) for entry in run["results"]]
+    assert len(keys) == len(set(keys)), "every benchmark should have its own key"
+
+    # a run compared to a copy with doubled throughputs is a regression
+    for entry in run["results"]:
+        entry["value"] *= 2
+    baseline = str(tmp_path / "baseline.json")
+    with open(baseline, "w") as f:
+        json.dump(run, f)
+    assert suite.main(args[:-2] + ["--group", "energy", "--baseline", baseline]) == 1
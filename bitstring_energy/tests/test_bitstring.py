@@ -63,4 +63,107 @@ def test_methods():
     assert np.array_equal(bs_array, np.array([1,0,1,0,1])), f"The array should be [1,0,1,0,1], but we got {bs_array}"
 
     bs_int = bitString.int()
-    assert bs_int == 21, f"The bitstring should be 21, but we got {bs_int}"
\ No newline at end of file
+    assert bs_int == 21, f"The bitstring should be 21, but we got {bs_int}"
+
+def test_packed_bitstring():
+    N = 130
+    rng = np.random.default_rng(0)
+    config = rng.integers(0, 2, size=N)
+    bitString = bse.BitString(N=N)
+    bitString.set_config(config)
+
+    packed = bitString.pack()
+    assert len(packed.words) == 3, f"130 bits should fit in 3 words, but we got {len(packed.words)}"
+    assert str(packed) == str(bitString), f"The bitstring should be {bitString}, but we got {packed}"
+    assert packed.on() == bitString.on() and packed.off() == bitString.off()
+    assert packed.int() == bitString.int(), "Both representations should have the same integer value"
+    assert packed == bitString and bitString == packed and packed.unpack() == bitString
+
+    copied = packed.copy()
+    assert copied == packed and hash(copied) == hash(packed)
+    copied.flip(129)
+    assert copied != packed and copied[129] == 1 - packed[129]
+    assert copied[-1] == copied[129]
+    assert len({packed, copied, packed.copy()}) == 2, "Equal bitstrings should hash the same"
+
+    copied[5] = 1
+    assert copied[5] == 1
+    copied[5] = 0
+    assert copied[5] == 0
+    try:
+        copied[5] = 2 # should raise an error
+    except Exception as e:
+        assert isinstance(e, ValueError), f"Should raise a ValueError, but we got {e}"
+
+    packed.set_int_config(3**80)
+    assert packed.int() == 3**80
+    bitString.set_int_config(3**80)
+    assert np.array_equal(packed.config, bitString.config)
+
+    # the unpacked copy is read-only, so in-place updates fail loudly
+    with pytest.raises(ValueError):
+        packed.config[0] = 1 - packed.config[0]
+    with pytest.raises(ValueError):
+        bse.metropolis_montecarlo(bse.hypercubic_lattice((8,), J=-1), bse.PackedBitString(8), 1.0, 50, 0)
+
+
+def test_bulk_conversions():
+    bits = bse.int_to_bits(np.arange(16), 4)
+    assert bits.shape == (16, 4)
+    assert np.array_equal(bits[10], [1, 0, 1, 0]), f"10 should be 1010, but we got {bits[10]}"
+    assert np.array_equal(bse.bits_to_int(bits), np.arange(16))
+    assert bse.bits_to_int(bse.int_to_bits(21, 5)) == 21
+
+    # arbitrary precision beyond 64 bits
+    values = [0, 1, 2**70 + 5, 3**50, 2**100 - 1]
+    bits = bse.int_to_bits(values, 100)
+    assert bits.shape == (5, 100)
+    assert list(bse.bits_to_int(bits)) == values
+    assert bse.bits_to_int(bse.int_to_bits(3**50, 100)) == 3**50
+
+    bitString = bse.BitString(N=100)
+    bitString.set_int_config(2**99 + 1)
+    assert bitString[0] == 1 and bitString[99] == 1 and bitString.on() == 2
+    assert bitString.int() == 2**99 + 1
+
+
+def test_bitstring_array():
+    values = np.array([21, 3, 21, 0, 31])
+    array = bse.BitStringArray.from_ints(values, 5)
+    assert len(array) == 5 and array.n == 5
+    assert np.array_equal(array.int(), values)
+    assert np.array_equal(array.on(), [3, 2, 3, 0, 5])
+    assert np.array_equal(array.off(), [2, 3, 2, 5, 0])
+    assert str(array[0]) == "10101", f"The first bitstring should be 10101, but we got {array[0]}"
+
+    # rows are views: writing through the BitString changes the array
+    view = array[1]
+    view.flip(0)
+    view[1] = 1
+    assert array.int()[1] == 27, f"The view should write into the array, but we got {array.int()[1]}"
+    view.set_int_config(2)
+    assert array.int()[1] == 2
+
+    array.flip([0, 4])
+    assert np.array_equal(array.int(), [4, 19, 4, 17, 14])
+    array.flip(2, rows=[3])
+    assert array.int()[3] == 21
+
+    single = bse.BitString(5)
+    single.set_int_config(4)
+    assert np.array_equal(array.hamming(single), [0, 4, 0, 2, 2])
+    distances = array.hamming(array)
+    assert distances.shape == (5, 5) and np.array_equal(np.diag(distances), np.zeros(5))
+    assert np.array_equal(distances[1], array.hamming(array[1]))
+
+    unique, counts = array.unique(return_counts=True)
+    assert np.array_equal(unique.int(), [4, 14, 19, 21]) and np.array_equal(counts, [2, 1, 1, 1])
+    array.sort()
+    assert np.array_equal(array.int(), [4, 4, 14, 19, 21])
+
+    unpacked = bse.BitStringArray.from_packed(array.pack(), 5)
+    assert unpacked == array
+    copied = bse.BitStringArray.from_bitstrings(list(array))
+    assert copied == array
+    copied.flip(0)
+    assert copied != array, "A copy should not share the buffer"
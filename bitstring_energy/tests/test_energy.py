@@ -1,6 +1,8 @@
 import bitstring_energy as bse
 import networkx as nx
 import numpy as np
+import pytest
+from bitstring_energy.TransferMatrix import bandwidth
 
 
  # Create graph
@@ -37,11 +39,7 @@ def get_IsingHamiltonian(G, mus=None):
 
     if len(G.nodes()) != len(mus):
         raise Exception("Dimension Mismatch")
-    J = [[] for i in G.nodes()]
-    for e in G.edges:
-        J[e[0]].append((e[1], G.edges[e]['weight']))
-        J[e[1]].append((e[0], G.edges[e]['weight']))
-    return bse.IsingHamiltonian(J,mus)
+    return bse.IsingHamiltonian.from_networkx(G, mu=mus)
 
 # Testing the energy function on a 1D Ising model
 def test_energy():    
@@ -84,6 +82,79 @@ def test_energy():
     # lowest_energy = bse.energy(lowest_energy_state, G)
     # assert lowest_energy == -9, f"The lowest energy should be -9. However we got {lowest_energy}"
 
+def test_csr_couplings():
+    N = 10
+    G = build_1d_graph_2(N, 1.5)
+    ham = get_IsingHamiltonian(G, mus=[.1*i for i in range(N)])
+
+    assert ham.indptr[-1] == 2*G.number_of_edges(), "Every edge should be stored once per direction"
+    for i in range(N):
+        neighbors = ham.indices[ham.indptr[i]:ham.indptr[i+1]]
+        assert sorted(neighbors) == sorted(G.neighbors(i)), f"Wrong neighbors for site {i}"
+
+    J_matrix = ham.J_matrix
+    assert np.allclose(np.diag(J_matrix), ham.mu), "The fields should be on the diagonal"
+    assert J_matrix[2, 5] == 1.5 and J_matrix[5, 2] == 0, "The couplings should be in the upper triangle"
+
+    # flipping a spin changes the energy by -2 s_i h_i
+    conf = bse.BitString(N)
+    conf.set_int_config(333)
+    for i in range(N):
+        E_before = ham.energy(conf)
+        s_i = 2*conf[i] - 1
+        conf.flip(i)
+        assert np.isclose(ham.energy(conf) - E_before, -2*s_i*ham.local_field(conf.config, i))
+        conf.flip(i)
+
+    # a configuration of the wrong length is rejected
+    with pytest.raises(ValueError):
+        ham.energy(bse.BitString(N - 4))
+
+def test_batched_energies():
+    N = 10
+    G = build_1d_graph_2(N, 0.7)
+    ham = get_IsingHamiltonian(G, mus=[.1*i - .3 for i in range(N)])
+
+    rng = np.random.default_rng(7)
+    configs = rng.integers(0, 2, size=(3000, N), dtype=np.uint8)
+    E, M = ham.energies(configs)
+
+    conf = bse.BitString(N)
+    for b in range(len(configs)):
+        conf.set_config(configs[b])
+        Ei, Mi = ham.compute_energy_and_mag(conf, 1)
+        assert E[b] == Ei and M[b] == Mi, f"Batched values ({E[b]}, {M[b]}) differ from ({Ei}, {Mi})"
+
+    E_packed, M_packed = ham.energies(np.packbits(configs, axis=1), packed=True)
+    assert np.array_equal(E_packed, E) and np.array_equal(M_packed, M)
+    E_bool, _ = ham.energies(configs.astype(bool))
+    assert np.array_equal(E_bool, E)
+    E_array, _ = ham.energies(bse.BitStringArray(configs=configs))
+    assert np.array_equal(E_array, E)
+
+def test_coloring():
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph(N, 1), mus=[.1 for i in range(N)])
+    classes = ham.coloring()
+    assert len(classes) == 2, f"An even ring should be 2-colorable, but we got {len(classes)} colors"
+
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, 1), mus=[.1 for i in range(N)])
+    classes = ham.coloring()
+    assert sorted(np.concatenate(classes)) == list(range(N)), "Every site should get exactly one color"
+    for sites in classes:
+        for i in sites:
+            neighbors = ham.indices[ham.indptr[i]:ham.indptr[i+1]]
+            assert not np.isin(neighbors, sites).any(), f"Site {i} is coupled to a site of its own color"
+
+    # the vectorized fields agree with the single site ones, also for batches
+    configs = np.random.default_rng(1).integers(0, 2, size=(4, N))
+    sites = np.array([9, 4, 0, 4])
+    fields = ham.local_fields(configs, sites)
+    for b in range(len(configs)):
+        expected = [ham.local_field(configs[b], i) for i in sites]
+        assert np.allclose(fields[b], expected)
+        assert np.allclose(ham.local_fields(configs[b], sites), expected)
+
 def test_avg_values():
     # Define a new configuration instance for a 6-site lattice
     N = 6
@@ -101,6 +172,52 @@ def test_avg_values():
     assert np.isclose(HC, 0.59026994)
     assert np.isclose(MS, 0.05404295) 
 
+def test_avg_values_low_temperature():
+    N = 6
+    conf = bse.BitString(N=N)
+    G = build_1d_graph(N, 2)
+    ham = get_IsingHamiltonian(G, mus=[1.1 for i in range(N)])
+
+    # exp(-E/T) overflows a float64 here, the enumeration must not
+    E, M, HC, MS = ham.compute_average_values(conf, 0.01)
+    assert np.isclose(E, -12.0), f"The energy should be the ground state energy -12, but we got {E}"
+    assert np.all(np.isfinite([E, M, HC, MS])), "The averages should be finite at low temperature"
+
+    # the block size must not change the result
+    small_chunks = bse.exact_average_values(ham, N, 1, chunk_size=5)
+    assert np.allclose(small_chunks, ham.compute_average_values(conf, 1))
+
+def test_avg_values_gray_code():
+    N = 10
+    conf = bse.BitString(N=N)
+    G = build_1d_graph_2(N, -1.5)
+    ham = get_IsingHamiltonian(G, mus=[.3 for i in range(N)])
+
+    expected = ham.compute_average_values(conf, 2, method="vectorized")
+    # walk the 6 high-order spins one flip at a time over blocks of 16 states
+    gray = bse.exact_average_values(ham, N, 2, method="gray", chunk_size=16)
+    assert np.allclose(gray, expected), f"Gray-code averages {gray} differ from {expected}"
+
+def test_avg_values_sweep(tmp_path):
+    N = 10
+    conf = bse.BitString(N=N)
+    G = build_1d_graph_2(N, 1)
+    ham = get_IsingHamiltonian(G, mus=[.1 for i in range(N)])
+
+    temps = np.linspace(0.5, 4, 8)
+    E, M, HC, MS = ham.compute_average_values_sweep(temps)
+    for i, T in enumerate(temps):
+        expected = ham.compute_average_values(conf, T)
+        assert np.allclose((E[i], M[i], HC[i], MS[i]), expected), \
+            f"Sweep differs from the single temperature result at T={T}"
+
+    # the density of states is written to the cache and read back
+    cache = str(tmp_path / "dos.npz")
+    first = ham.compute_average_values_sweep(temps, cache=cache)
+    dos = bse.DensityOfStates.load(cache)
+    assert dos.counts.sum() == 2**N, f"The histogram should hold 2^{N} states, but we got {dos.counts.sum()}"
+    assert np.allclose(ham.compute_average_values_sweep(temps, cache=cache), first)
+
 def test_metropolis_montecarlo():
 
     import bitstring_energy as bse 
@@ -137,4 +254,120 @@ def test_monte_carlo():
     assert np.isclose(MS, 1.46663062, rtol=1e+1), "Calculated Magnetic Susceptibility is not correct"
 
     
-   
\ No newline at end of file
+   
+
+def test_graph_constructors():
+    N = 10
+    G = build_1d_graph_2(N, 1)
+    mus = np.linspace(-1, 1, N)
+    J = [[] for i in G.nodes()]
+    for e in G.edges:
+        J[e[0]].append((e[1], G.edges[e]['weight']))
+        J[e[1]].append((e[0], G.edges[e]['weight']))
+    from_list = bse.IsingHamiltonian(J, mus)
+    from_graph = bse.IsingHamiltonian.from_networkx(G, mu=mus)
+    src, dst = np.array(G.edges).T
+    from_edges = bse.IsingHamiltonian.from_edges(src, dst, 1, mus)
+
+    configs = bse.BitStringArray.from_ints(np.arange(2**N), N)
+    E, M = from_list.energies(configs)
+    for hamiltonian in (from_graph, from_edges):
+        assert np.allclose(hamiltonian.energies(configs)[0], E)
+        assert np.array_equal(hamiltonian.J_matrix, from_list.J_matrix)
+    assert sorted(from_edges.J[4]) == sorted(J[4])
+
+    # node labels other than 0..N-1 follow the order of G.nodes()
+    relabelled = nx.relabel_nodes(G, {i: f"s{i}" for i in range(N)})
+    assert np.allclose(bse.IsingHamiltonian.from_networkx(relabelled, mu=mus).energies(configs)[0], E)
+
+    with pytest.raises(ValueError):
+        bse.IsingHamiltonian.from_edges([0, 1], [1, 1], 1.0, np.zeros(2))
+
+
+def test_hypercubic_lattice():
+    # a periodic ring matches build_1d_graph
+    N = 8
+    ring = bse.hypercubic_lattice((N,), J=1, mu=.1)
+    conf = bse.BitString(N)
+    conf.set_config([0, 0, 0, 0, 0, 0, 1, 1])
+    assert np.isclose(ring.energy(conf), 3.6)
+
+    # every site of a periodic L^d lattice has 2d neighbors
+    for shape in [(5,), (4, 6), (3, 4, 5)]:
+        src, dst = bse.hypercubic_edges(shape)
+        assert len(src) == len(shape) * np.prod(shape)
+        lattice = bse.hypercubic_lattice(shape)
+        assert np.all(np.diff(lattice.indptr) == 2 * len(shape))
+    # open boundaries, and no double bond across a length 2 dimension
+    assert len(bse.hypercubic_edges((4, 4), periodic=False)[0]) == 24
+    assert len(bse.hypercubic_edges((2, 3))[0]) == 3 + 6
+
+    # all spins up on a 2D ferromagnet: E = -2N
+    lattice = bse.hypercubic_lattice((6, 6), J=-1)
+    assert np.isclose(lattice.energies(np.ones((1, 36)))[0][0], -72)
+
+
+def test_lowest_states_and_spectrum(tmp_path):
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, 1), mus=list(np.linspace(-.5, .5, N)))
+    E_all = ham.energies(bse.BitStringArray.from_ints(np.arange(2**N), N))[0]
+    order = np.lexsort((np.arange(2**N), np.round(E_all, 10)))
+    for method in ("gray", "vectorized"):
+        # small blocks, so several blocks are merged in the heap
+        states, energies = bse.lowest_states(ham, N, 20, method=method, chunk_size=64)
+        assert np.array_equal(states, order[:20]), f"{method}: wrong lowest states or order"
+        assert np.allclose(E_all[states], energies)
+        assert len(bse.lowest_states(ham, N, 0, method=method)[0]) == 0
+
+    # integer couplings and fields, whose levels are heavily degenerate:
+    # k falls inside a level and the ties go to the lowest states
+    src, dst = np.triu_indices(12, 1)
+    for seed in range(8):
+        rng = np.random.default_rng(seed)
+        tied = bse.IsingHamiltonian.from_edges(src, dst, rng.choice([-1.0, 0.0, 1.0], len(src)),
+                                               rng.choice([0.0, 1.0], 12))
+        E_tied = tied.energies(bse.BitStringArray.from_ints(np.arange(2**12), 12))[0]
+        tied_order = np.lexsort((np.arange(2**12), np.round(E_tied, 10)))
+        for method in ("gray", "vectorized"):
+            for k in (1, 3, 10):
+                states, energies = bse.lowest_states(tied, 12, k, method=method, chunk_size=1024)
+                assert np.array_equal(states, tied_order[:k]), f"{method}: wrong tie order with k={k}"
+
+        spectrum = bse.energy_spectrum(ham, N, path=str(tmp_path / f"{method}.npy"), method=method, chunk_size=64)
+        assert spectrum.dtype == np.float32
+        assert np.allclose(np.load(tmp_path / f"{method}.npy", mmap_mode="r"), E_all, atol=1e-5)
+    assert np.allclose(bse.energy_spectrum(ham, N), E_all, atol=1e-5)
+
+    # the sorted spectrum, with the degeneracies of the levels
+    levels, counts = bse.DensityOfStates.from_hamiltonian(ham, N).energy_levels()
+    assert counts.sum() == 2**N and np.all(np.diff(levels) > 0)
+    assert np.isclose(levels[0], E_all.min())
+
+
+def test_transfer_matrix():
+    # rings and periodic strips with random couplings, against the enumeration
+    rng = np.random.default_rng(0)
+    for shape in [(7,), (12,), (4, 3), (3, 4), (6, 2)]:
+        N = int(np.prod(shape))
+        src, dst = bse.hypercubic_edges(shape)
+        ham = bse.IsingHamiltonian.from_edges(src, dst, rng.normal(size=len(src)), rng.normal(size=N))
+        conf = bse.BitString(N)
+        for T in (0.5, 1.3):
+            expected = ham.compute_average_values(conf, T, method="gray")
+            transfer = ham.compute_average_values(conf, T, method="transfer")
+            assert np.allclose(transfer, expected), f"{shape} at T={T}: {transfer} differs from {expected}"
+
+    # a long ring is picked automatically and matches the thermodynamic limit
+    N = 2000
+    ham = bse.hypercubic_lattice((N,), J=-1)
+    assert bandwidth(ham) == 1 and ham._solver(N) == "transfer"
+    E, M, HC, MS = ham.compute_average_values(bse.BitString(N), 2.0)
+    assert np.isclose(E / N, -np.tanh(0.5)), f"Energy per site {E / N} should be -tanh(1/T)"
+    temps = np.array([1.0, 2.0])
+    assert np.allclose(ham.compute_average_values_sweep(temps)[0] / N, -np.tanh(1/temps))
+
+    # couplings that skip a block cannot use transfer matrices
+    ham = get_IsingHamiltonian(build_1d_graph_2(10, 1))
+    assert ham._solver(10) == "gray"
+    with pytest.raises(ValueError):
+        bse.TransferMatrix(ham, width=1)
@@ -0,0 +1,38 @@
+"""
+Tests for the exact branch and bound ground state search.
+"""
+
+import pytest
+import numpy as np
+import bitstring_energy as bse
+from bitstring_energy.GroundState import search_order
+from bitstring_energy.tests.test_energy import build_1d_graph_2, get_IsingHamiltonian
+
+
+def brute_force(ham):
+    E = ham.energies(bse.BitStringArray.from_ints(np.arange(2**ham.n), ham.n))[0]
+    return E.min(), np.isclose(E, E.min()).sum()
+
+
+def test_ground_state():
+    N = 12
+    rng = np.random.default_rng(3)
+    src, dst = bse.hypercubic_edges((3, 4))
+    glass = bse.IsingHamiltonian.from_edges(src, dst, rng.choice([-1.0, 1.0], len(src)), np.zeros(N))
+    field = bse.IsingHamiltonian.from_edges(src, dst, rng.choice([-1.0, 1.0], len(src)), rng.normal(0, .3, N))
+    ring = get_IsingHamiltonian(build_1d_graph_2(10, 1), mus=[.1 for i in range(10)])
+    for ham in (glass, field, ring):
+        E_min, degeneracy = brute_force(ham)
+        for backend in ("python", "auto"):
+            best, energy, count = bse.ground_state(ham, backend=backend)
+            assert np.isclose(energy, E_min), f"Found {energy} instead of {E_min}"
+            assert np.isclose(ham.energy(best), E_min)
+            assert count == degeneracy, f"Found {count} ground states instead of {degeneracy}"
+
+    # the tree split into subtrees gives the same answer, even from a loose bound
+    best, energy, count = bse.ground_state(field, n_workers=2, backend="python", upper_bound=100)
+    assert np.isclose(energy, brute_force(field)[0]) and count == brute_force(field)[1]
+
+    assert sorted(search_order(glass)) == list(range(N))
+    with pytest.raises(ValueError):
+        bse.ground_state(glass, upper_bound=brute_force(glass)[0] - 1)
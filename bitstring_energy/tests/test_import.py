@@ -0,0 +1,31 @@
+"""
+Tests that importing the package stays cheap.
+"""
+
+import subprocess
+import sys
+import pytest
+from bitstring_energy import Kernels
+from bitstring_energy._optional import optional_import
+
+
+def test_no_heavy_imports():
+    # run in a fresh interpreter, this one already imported them for other tests
+    code = ("import sys, bitstring_energy; "
+            "print(' '.join(m for m in ('networkx', 'matplotlib', 'numba') if m in sys.modules))")
+    loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split()
+    assert loaded == [], f"import bitstring_energy should not import {loaded}"
+
+
+def test_optional_import():
+    assert optional_import("numpy", "test").__name__ == "numpy"
+    with pytest.raises(ImportError, match=r"bitstring_energy\[graph\]"):
+        optional_import("not_a_real_module", "graph")
+
+
+def test_missing_numba_hint(monkeypatch):
+    # a None entry in sys.modules makes the import fail as if numba were missing
+    monkeypatch.setitem(sys.modules, "numba", None)
+    monkeypatch.setattr(Kernels, "_compiled_sweeps", None)
+    with pytest.raises(ImportError, match=r"bitstring_energy\[fast\]"):
+        Kernels._compiled_kernel()
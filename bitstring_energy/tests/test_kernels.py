@@ -0,0 +1,60 @@
+"""
+Tests for the compiled Metropolis sweep kernels.
+"""
+
+import pytest
+import numpy as np
+import bitstring_energy as bse
+from bitstring_energy.Kernels import acceptance_table, available_backends, metropolis_sweep
+from bitstring_energy.tests.test_energy import build_1d_graph, build_1d_graph_2, get_IsingHamiltonian
+
+
+def test_acceptance_table():
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, 1), mus=[.1 for i in range(N)])
+    table, quantum = acceptance_table(ham, 2)
+    assert np.isclose(quantum, 0.1), f"The energy quantum should be 0.1, but we got {quantum}"
+    # largest field: degree 4 site with mu = 0.1
+    assert len(table) == 42, f"The table should cover energy changes up to 8.2, but we got {len(table)} entries"
+    assert np.allclose(table, np.exp(-0.2*np.arange(42)/2))
+
+    ham = get_IsingHamiltonian(build_1d_graph(N, np.pi), mus=[.1 for i in range(N)])
+    table, quantum = acceptance_table(ham, 2)
+    assert len(table) == 0 and quantum == 0, "Irrational couplings should not be tabulated"
+
+
+@pytest.mark.skipif("numba" not in available_backends(), reason="numba is not installed")
+@pytest.mark.parametrize("Jval", [1, np.pi])
+def test_backends_agree(Jval):
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, Jval), mus=[.1 for i in range(N)])
+
+    trajectories = []
+    for backend in ["numba", "python"]:
+        conf = bse.BitString(N)
+        conf.set_int_config(77)
+        rng = np.random.default_rng(42)
+        dE, dM = metropolis_sweep(ham, conf, 1.5, n_sweeps=200, rng=rng, backend=backend)
+        trajectories.append((conf.int(), dE, dM))
+    assert trajectories[0][0] == trajectories[1][0], "Both backends should end in the same configuration"
+    assert np.allclose(trajectories[0][1], trajectories[1][1])
+    assert np.array_equal(trajectories[0][2], trajectories[1][2])
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_kernel_montecarlo(backend):
+    N = 8
+    ham = get_IsingHamiltonian(build_1d_graph(N, 1), mus=[.1 for i in range(N)])
+    conf = bse.BitString(N)
+    conf.initialize(M=4)
+
+    E_exact, M_exact, HC_exact, MS_exact = ham.compute_average_values(conf, 2)
+    np.random.seed(3)
+    E, M, EE, MM = bse.metropolis_montecarlo(ham, conf, T=2, nsweep=8000, nburn=1000, backend=backend)
+    assert np.isclose(E[-1], E_exact, atol=0.1), f"Sampled energy {E[-1]} is far from {E_exact}"
+    assert np.isclose(M[-1], M_exact, atol=0.15), f"Sampled magnetization {M[-1]} is far from {M_exact}"
+
+    # the sweeps must keep track of the energy they change
+    E_before = ham.energy(conf)
+    dE, dM = metropolis_sweep(ham, conf, 2, n_sweeps=5, backend=backend)
+    assert np.isclose(ham.energy(conf) - E_before, dE.sum())
@@ -0,0 +1,251 @@
+"""
+Tests for the Monte Carlo samplers.
+"""
+
+import pytest
+import numpy as np
+import bitstring_energy as bse
+from bitstring_energy.Cluster import _wolff_step, _swendsen_wang_step
+from bitstring_energy.Kernels import metropolis_sweep
+from bitstring_energy.Statistics import BlockingMoments, samples_from_running_means
+from bitstring_energy.tests.test_energy import build_1d_graph, build_1d_graph_2, get_IsingHamiltonian
+
+
+def test_checkerboard_montecarlo():
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, 1), mus=[.1 for i in range(N)])
+    conf = bse.BitString(N)
+    conf.initialize(M=5)
+
+    E_exact, M_exact, HC_exact, MS_exact = ham.compute_average_values(conf, 2)
+    np.random.seed(11)
+    E, M, EE, MM = bse.metropolis_montecarlo(ham, conf, T=2, nsweep=8000, nburn=1000, backend="checkerboard")
+    assert np.isclose(E[-1], E_exact, atol=0.1), f"Sampled energy {E[-1]} is far from {E_exact}"
+    assert np.isclose(M[-1], M_exact, atol=0.15), f"Sampled magnetization {M[-1]} is far from {M_exact}"
+    HC = (EE[-1] - E[-1]*E[-1])/2/2
+    assert np.isclose(HC, HC_exact, atol=0.15), f"Sampled heat capacity {HC} is far from {HC_exact}"
+
+
+def test_parallel_tempering():
+    N = 8
+    ham = get_IsingHamiltonian(build_1d_graph(N, 1), mus=[.1 for i in range(N)])
+    conf = bse.BitString(N)
+    temps = np.array([1.0, 1.5, 2.0, 3.0])
+
+    E, M, EE, MM, swap_rate = bse.parallel_tempering(ham, temps, nsweep=10000, nburn=500, n_workers=1, seed=5)
+    for k, T in enumerate(temps):
+        E_exact, M_exact, HC_exact, MS_exact = ham.compute_average_values(conf, T)
+        assert np.isclose(E[k], E_exact, atol=0.2), f"Sampled energy {E[k]} is far from {E_exact} at T={T}"
+        assert np.isclose(M[k], M_exact, atol=0.2), f"Sampled magnetization {M[k]} is far from {M_exact} at T={T}"
+    assert len(swap_rate) == len(temps) - 1
+    assert np.all((swap_rate > 0) & (swap_rate <= 1)), f"Swap rates {swap_rate} should be in (0, 1]"
+
+    # the process pool gives the same chains as the serial run
+    pooled = bse.parallel_tempering(ham, temps, nsweep=200, nburn=50, n_workers=2, seed=5)
+    serial = bse.parallel_tempering(ham, temps, nsweep=200, nburn=50, n_workers=1, seed=5)
+    for a, b in zip(pooled, serial):
+        assert np.allclose(a, b)
+
+
+def test_montecarlo_chains():
+    N = 8
+    ham = get_IsingHamiltonian(build_1d_graph(N, 1), mus=[.1 for i in range(N)])
+    conf = bse.BitString(N)
+    conf.initialize(M=4)
+    start = conf.int()
+
+    chains, mean, stderr = bse.metropolis_montecarlo_chains(ham, conf, T=2, nsweep=2000, nburn=200,
+                                                            n_chains=6, seed=9, n_workers=1, backend="checkerboard")
+    assert chains.shape == (6, 4), f"Expected one row per chain, but we got shape {chains.shape}"
+    assert conf.int() == start, "The initial configuration should not be modified"
+    assert np.allclose(mean, chains.mean(axis=0))
+    assert np.all(stderr > 0)
+
+    E_exact, M_exact, HC_exact, MS_exact = ham.compute_average_values(conf, 2)
+    assert abs(mean[0] - E_exact) < 5*stderr[0] + 0.02, f"Pooled energy {mean[0]} +- {stderr[0]} is far from {E_exact}"
+    assert abs(mean[1] - M_exact) < 5*stderr[1] + 0.02, \
+        f"Pooled magnetization {mean[1]} +- {stderr[1]} is far from {M_exact}"
+
+    # the chains only depend on the seed, not on the number of workers
+    pooled, _, _ = bse.metropolis_montecarlo_chains(ham, conf, T=2, nsweep=2000, nburn=200,
+                                                    n_chains=6, seed=9, n_workers=2, backend="checkerboard")
+    assert np.allclose(pooled, chains)
+
+
+def test_running_moments():
+    values = np.random.default_rng(2).normal(1e6, 3.0, size=5000)
+    stats = bse.Statistics.RunningMoments()
+    for x in values[:1234]:
+        stats.add(x)
+    stats.add_many(values[1234:])
+    assert stats.count == len(values)
+    assert np.isclose(stats.mean, values.mean(), rtol=0, atol=1e-8)
+    assert np.isclose(stats.variance(), values.var(), rtol=1e-10)
+
+
+def test_montecarlo_stream():
+    N = 8
+    ham = get_IsingHamiltonian(build_1d_graph(N, 1), mus=[.1 for i in range(N)])
+
+    conf = bse.BitString(N)
+    conf.initialize(M=4)
+    start = conf.config.copy()
+    E, M, EE, MM = bse.metropolis_montecarlo(ham, conf, T=2, nsweep=3000, nburn=100, rng=np.random.default_rng(4))
+
+    reports = []
+    conf.set_config(start)
+    final = bse.metropolis_montecarlo_stream(ham, conf, T=2, nsweep=3000, nburn=100, every=500,
+                                             callback=lambda *report: reports.append(report),
+                                             rng=np.random.default_rng(4))
+    # same samples, so the same averages as the array version
+    assert np.allclose(final, (E[-1], M[-1], EE[-1], MM[-1]))
+    assert [report[0] for report in reports] == [500, 1000, 1500, 2000, 2500, 3000]
+    assert np.isclose(reports[1][1], E[999]), "The reports should hold the running averages"
+
+
+def test_incremental_tracking():
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, 1.3), mus=[.2 for i in range(N)])
+    for backend in [None, "checkerboard", "python"]:
+        results = []
+        for recompute_every in [0, 1]:
+            conf = bse.BitString(N)
+            conf.set_int_config(300)
+            results.append(bse.metropolis_montecarlo(ham, conf, T=1.5, nsweep=500, nburn=10, backend=backend,
+                                                     rng=np.random.default_rng(8), recompute_every=recompute_every))
+        for tracked, recomputed in zip(*results):
+            assert np.allclose(tracked, recomputed), \
+                f"Tracked observables drift from the recomputed ones with {backend}"
+
+
+def test_trajectory(tmp_path):
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, 1), mus=[.1 for i in range(N)])
+    conf = bse.BitString(N)
+    conf.initialize(M=5)
+    path = str(tmp_path / "run.traj")
+
+    with bse.TrajectoryWriter(path, N, buffer_size=64) as writer:
+        E, M, EE, MM = bse.metropolis_montecarlo(ham, conf, T=2, nsweep=300, nburn=10, trajectory=writer)
+    final = conf.int()
+
+    reader = bse.TrajectoryReader(path)
+    assert len(reader) == 300, f"Every sweep should be stored, but we got {len(reader)} samples"
+    assert isinstance(reader.energies, np.memmap)
+    assert np.isclose(reader.energies.mean(), E[-1]) and np.isclose(reader.magnetizations.mean(), M[-1])
+    assert reader[-1].int() == final, "The last sample should be the final configuration"
+
+    configs = reader.configs(slice(100, 200))
+    E_stored, M_stored = ham.energies(configs)
+    assert np.allclose(E_stored, reader.energies[100:200]) and np.array_equal(M_stored, reader.magnetizations[100:200])
+
+    # appending keeps the earlier samples
+    with bse.TrajectoryWriter(path, N, append=True) as writer:
+        writer.append_many(configs, E_stored, M_stored)
+    reader = bse.TrajectoryReader(path)
+    assert len(reader) == 400 and reader.configs(slice(300, 400)) == configs
+
+    # a partial record left by an interrupted run is dropped before appending
+    with open(path, "ab") as f:
+        f.write(b"\x01" * 5)
+    with bse.TrajectoryWriter(path, N, append=True) as writer:
+        writer.append_many(configs, E_stored, M_stored)
+    reader = bse.TrajectoryReader(path)
+    assert len(reader) == 500 and reader.configs(slice(400, 500)) == configs
+    assert np.array_equal(reader.energies[400:], E_stored)
+
+
+def test_acceptance_tables():
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, 1), mus=[.1 for i in range(N)])
+    table, quantum = ham.acceptance_table(2)
+    assert ham.acceptance_table(2)[0] is table, "The table of a temperature should be cached"
+    delta_e = np.array([-1.2, 0.0, 0.2, 2.2, 8.2])
+    assert np.allclose(ham.acceptance_probability(delta_e, 2), np.exp(-np.maximum(delta_e, 0)/2))
+
+    # continuous couplings fall back to exp
+    continuous = bse.IsingHamiltonian.from_edges([0, 1], [1, 2], [np.pi, np.e], np.zeros(3))
+    assert continuous.energy_quantum() == 0 and len(continuous.acceptance_table(1.5)[0]) == 0
+    assert np.allclose(continuous.acceptance_probability(delta_e, 1.5), np.exp(-np.maximum(delta_e, 0)/1.5))
+
+    # metropolis_step draws one number per site, like the sweep kernels
+    conf = bse.BitString(N)
+    conf.initialize(M=5)
+    other = bse.BitString(N)
+    other.set_config(conf.config)
+    rng, other_rng = np.random.default_rng(3), np.random.default_rng(3)
+    for sweep in range(20):
+        bse.metropolis_step(ham, conf, 1.5, rng=rng)
+        metropolis_sweep(ham, other, 1.5, rng=other_rng, backend="python")
+        assert conf == other, f"metropolis_step and the python kernel differ after {sweep + 1} sweeps"
+
+
+def test_cluster_montecarlo():
+    # ferromagnetic ring with a field, and a frustrated graph with mixed signs
+    N = 10
+    ferro = bse.hypercubic_lattice((N,), J=-1, mu=.1)
+    mixed = get_IsingHamiltonian(build_1d_graph_2(N, 1), mus=list(np.linspace(-.3, .3, N)))
+    rng = np.random.default_rng(5)
+    for ham in (ferro, mixed):
+        conf = bse.BitString(N)
+        E_exact, M_exact, HC_exact, MS_exact = ham.compute_average_values(conf, 2)
+        for method in ("wolff", "swendsen_wang"):
+            conf.initialize(M=5)
+            E, M, EE, MM = bse.cluster_montecarlo(ham, conf, T=2, nsweep=4000, nburn=200, method=method, rng=rng)
+            assert np.isclose(E[-1], E_exact, atol=0.15), f"{method}: sampled energy {E[-1]} is far from {E_exact}"
+            assert np.isclose(M[-1], M_exact, atol=0.3), \
+                f"{method}: sampled magnetization {M[-1]} is far from {M_exact}"
+
+            # E and M are carried along from the cluster flips
+            E_track, M_track = ham.compute_energy_and_mag(conf, 2)
+            for sweep in range(50):
+                if method == "wolff":
+                    dE, dM = _wolff_step(ham, conf, 2, rng)
+                else:
+                    dE, dM = _swendsen_wang_step(ham, conf, 2, rng)
+                E_track += dE
+                M_track += dM
+            assert np.allclose((E_track, M_track), ham.compute_energy_and_mag(conf, 2))
+
+    with pytest.raises(ValueError):
+        bse.cluster_montecarlo(ferro, conf, T=2, nsweep=10, nburn=0, method="metropolis")
+
+
+def test_autocorrelation():
+    # AR(1) series x_i = phi x_{i-1} + noise has tau = (1 + phi)/(1 - phi)
+    rng = np.random.default_rng(0)
+    phi = 0.8
+    noise = rng.normal(size=50000)
+    x = np.zeros(len(noise))
+    for i in range(1, len(x)):
+        x[i] = phi*x[i-1] + noise[i]
+    tau = bse.integrated_time(x)
+    assert np.isclose(tau, 9, rtol=0.15), f"tau should be about 9, but we got {tau}"
+    mean, stderr, tau, ess = bse.error_analysis(x)
+    assert np.isclose(ess, len(x)/tau)
+
+    # the streaming blocking analysis matches the stored one
+    moments = BlockingMoments()
+    moments.add_many(x)
+    errors, counts = bse.blocking_errors(x)
+    assert np.allclose(moments.errors()[0][:len(errors)], errors)
+    assert np.isclose(moments.stderr(), stderr, rtol=0.25), \
+        f"Blocking error {moments.stderr()} should be close to {stderr}"
+
+    means = np.cumsum(x) / np.arange(1, len(x) + 1)
+    assert np.allclose(samples_from_running_means(means), x)
+
+
+def test_auto_stop():
+    N = 10
+    ham = get_IsingHamiltonian(build_1d_graph_2(N, 1), mus=[.1 for i in range(N)])
+    conf = bse.BitString(N)
+    conf.initialize(M=5)
+    reports = []
+    E, M, EE, MM, stderr, ess = bse.metropolis_montecarlo_stream(
+        ham, conf, T=2, nsweep=100000, nburn=100, every=500, target_stderr=0.05, errors=True,
+        callback=lambda *report: reports.append(report[0]), rng=np.random.default_rng(2))
+    assert reports[-1] < 100000, "Sampling should stop once the target error is reached"
+    assert np.all(stderr <= 0.05) and np.all(ess > 0) and np.all(ess <= reports[-1])
+    E_exact, M_exact, HC_exact, MS_exact = ham.compute_average_values(conf, 2)
+    assert np.isclose(E, E_exact, atol=0.25)